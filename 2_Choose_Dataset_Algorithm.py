@@ -21,6 +21,7 @@ dataset = st.radio(
 
 algo = st.selectbox("Select ML algorithm", options=ALGORITHMS, index=0)
 mode = st.radio("Explanation mode", options=["Beginner", "Expert"], index=0)
+tune = st.checkbox("Tune hyperparameters with cross-validation (slower on first run)", value=False)
 
 col1, col2 = st.columns(2)
 with col1:
@@ -28,6 +29,7 @@ with col1:
         st.session_state["dataset"] = dataset[0]
         st.session_state["algorithm"] = algo
         st.session_state["mode"] = mode
+        st.session_state["tune"] = tune
         st.success("Saved. Now open the relevant form page from the sidebar.")
 
 with col2:
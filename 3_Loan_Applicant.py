@@ -1,24 +1,38 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-from lib.ui import set_app_config, sidebar_user_card
+from lib.ui import (
+    attribution_panel,
+    begin_stage_timing,
+    drift_panel,
+    model_quality_panel,
+    set_app_config,
+    sidebar_user_card,
+    stage_timing_panel,
+    whatif_panel,
+)
 from lib.auth import require_dataset_and_algo
-from lib.data import load_loan_df
-from lib.models import train_model, predict_with_explanations
+from lib.instrument import stage
 
 set_app_config()
 sidebar_user_card()
 require_dataset_and_algo()
+timings = begin_stage_timing()
 
 if st.session_state["dataset"] != "loan":
     st.warning("You selected Student dataset. Please switch dataset on **Choose Dataset & Algorithm**.")
     st.stop()
 
+# data and model modules load pandas/sklearn; import them only once this page renders
+import pandas as pd
+
+from lib.data import fingerprint_df, load_loan_df
+from lib.drift import get_monitor
+from lib.models import RESULT_CACHE, get_model, get_all_models, compare_predictions, predict_with_explanations
+from lib.registry import train_or_load
+
 st.title("Loan Applicant — XplainLab")
 
-df = load_loan_df()
+df = load_loan_df(compact=True)
 
 with st.expander("Preview sample loan dataset"):
     st.dataframe(df.head(20), use_container_width=True)
@@ -30,9 +44,16 @@ mode = st.session_state["mode"]
 train_df = df.drop(columns=["Loan_ID"])
 target = "Loan_Status"
 
-model_bundle = train_model(train_df, target_col=target, algo=algo)
+with stage("page.get_model"):
+    if st.session_state.get("tune"):
+        from lib.tuning import get_tuned_model
+
+        model_bundle = get_tuned_model(train_df, target_col=target, algo=algo, trainer=train_or_load)
+    else:
+        model_bundle = get_model(train_df, target_col=target, algo=algo, trainer=train_or_load)
 
 st.caption(f"Model: **{algo}** | Mode: **{mode}** | Rows used: {model_bundle['metrics']['n_rows']} | Holdout Accuracy: {model_bundle['metrics']['accuracy_holdout']}")
+model_quality_panel(model_bundle, train_df)
 
 st.subheader("1) Enter Loan Applicant Details")
 
@@ -56,9 +77,11 @@ with st.form("loan_form"):
         credit_history = st.selectbox("Credit History", ["1", "0"])
         property_area = st.selectbox("Property Area", ["Urban", "Semiurban", "Rural"])
 
+    compare = st.checkbox("Compare all algorithms side by side")
     submitted = st.form_submit_button("Get Prediction", type="primary")
 
 if not submitted:
+    stage_timing_panel(timings)
     st.stop()
 
 input_row = pd.DataFrame(
@@ -77,14 +100,31 @@ input_row = pd.DataFrame(
     }]
 )
 
-result = predict_with_explanations(model_bundle, input_row=input_row, algo=algo)
+neighbor_index = None
+if algo == "KNN":
+    from lib.neighbors import get_neighbor_index
+
+    try:
+        with stage("page.neighbor_index"):
+            neighbor_index = get_neighbor_index(model_bundle, df, id_col="Loan_ID", target_col=target)
+    except ValueError:
+        neighbor_index = None
+
+result = predict_with_explanations(
+    model_bundle, input_row=input_row, algo=algo, neighbor_index=neighbor_index, cache=RESULT_CACHE
+)
+monitor = get_monitor(train_df, columns=model_bundle["X_cols"])
+monitor.update(input_row)
 
 # Output mapping
 pred = str(result["prediction"])
 approved = (pred.upper() == "Y")
 status_text = "APPROVED ✅" if approved else "REJECTED ❌"
 
-tabs = st.tabs(["2) Prediction Result", "3) Why? (Explanation)", "4) Visuals", "5) Explore Rules"])
+tab_names = ["2) Prediction Result", "3) Why? (Explanation)", "4) Visuals", "5) Explore Rules", "6) What-if"]
+if compare:
+    tab_names.append("7) Compare Algorithms")
+tabs = st.tabs(tab_names)
 
 with tabs[0]:
     st.subheader(status_text)
@@ -103,7 +143,8 @@ with tabs[0]:
     if mode == "Beginner":
         st.info(
             "This result is based on patterns learned from sample data. "
-            "You can change inputs (income, credit history, etc.) and observe how decisions change."
+            "You can change inputs (income, credit history, etc.) and observe how decisions change, "
+            "or sweep them in the **What-if** tab."
         )
 
 with tabs[1]:
@@ -128,7 +169,13 @@ with tabs[1]:
     st.write(f"**Model-specific explainability ({algo}):**")
 
     if algo == "Decision Tree":
-        st.code(result["explanations"].get("tree_rules", "No rules."), language="text")
+        path = result["explanations"].get("decision_path")
+        if path:
+            st.write("Rules this input satisfied, from the root of the tree to its leaf:")
+            for cond in path["conditions"]:
+                st.write("- ", cond["rule"])
+        with st.expander("Full decision tree"):
+            st.code(result["explanations"].get("tree_rules", "No rules."), language="text")
 
     elif algo == "Logistic Regression":
         top = result["explanations"].get("top_contributions", [])
@@ -136,31 +183,70 @@ with tabs[1]:
             st.write("No contribution data available.")
         else:
             st.write("Top feature contributions (bigger magnitude = more influence):")
-            st.dataframe(pd.DataFrame(top), use_container_width=True)
+            st.dataframe(pd.DataFrame(top).astype({"value": str}), use_container_width=True)
 
     elif algo == "KNN":
-        st.write(result["explanations"].get("knn_neighbors", {}))
+        knn_info = result["explanations"].get("knn_neighbors", {})
+        if knn_info.get("neighbors"):
+            st.write("Most similar records in the training data:")
+            st.dataframe(
+                pd.DataFrame([{"distance": n["distance"], **n["record"]} for n in knn_info["neighbors"]]),
+                use_container_width=True,
+            )
+        else:
+            st.write(knn_info)
+
+    st.divider()
+    attribution_panel(model_bundle, input_row, train_df)
 
 with tabs[2]:
-    st.subheader("Visuals")
+    from lib.importance import get_importance, importance_frame
+    from lib.visuals import chart
 
-    # Distribution plots using dataset
-    df_plot = df.copy()
-    df_plot["Credit_History"] = pd.to_numeric(df_plot["Credit_History"], errors="coerce")
+    st.subheader("Visuals")
 
+    data_fp = fingerprint_df(df)
     c1, c2 = st.columns(2)
 
     with c1:
-        fig, ax = plt.subplots(figsize=(6, 4))
-        sns.countplot(data=df_plot, x="Loan_Status", ax=ax)
-        ax.set_title("Loan Status Distribution (sample)")
-        st.pyplot(fig)
+        st.image(
+            chart(df, "count", x="Loan_Status", title="Loan Status Distribution (sample)", fingerprint=data_fp)
+        )
 
     with c2:
-        fig, ax = plt.subplots(figsize=(6, 4))
-        sns.boxplot(data=df_plot, x="Loan_Status", y="ApplicantIncome", ax=ax)
-        ax.set_title("Applicant Income vs Loan Status (sample)")
-        st.pyplot(fig)
+        st.image(
+            chart(
+                df,
+                "box",
+                x="Loan_Status",
+                y="ApplicantIncome",
+                title="Applicant Income vs Loan Status (sample)",
+                fingerprint=data_fp,
+            )
+        )
+
+    st.write("**What drives this model overall** (drop in holdout accuracy when a column is shuffled):")
+    try:
+        importance = get_importance(model_bundle, train_df)
+    except ValueError as e:
+        st.write(str(e))
+    else:
+        st.bar_chart(importance_frame(importance).set_index("feature")["importance"])
+        st.caption(
+            f"Permutation importance over {importance['n_rows']} holdout rows, "
+            f"{importance['n_repeats']} shuffles per column (holdout accuracy {importance['baseline']:.3f})."
+        )
+
+with tabs[4]:
+    st.subheader("What-if explorer")
+    whatif_panel(model_bundle, input_row, train_df)
+
+if compare:
+    with tabs[5]:
+        st.subheader("All algorithms on this input")
+        combined = get_all_models(train_df, target_col=target)
+        st.dataframe(compare_predictions(combined, input_row), use_container_width=True)
+        st.caption("All models share the same preprocessing and the same 75/25 train/holdout split.")
 
 with tabs[3]:
     st.subheader("Explore Rules & Tips")
@@ -175,5 +261,8 @@ with tabs[3]:
         st.write("- Try different algorithms to compare outcomes.")
         from lib.auth import go_choose
 
+drift_panel(monitor)
+stage_timing_panel(timings)
+
 if st.session_state["dataset"] != "loan":
     go_choose()
\ No newline at end of file
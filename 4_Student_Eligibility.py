@@ -1,24 +1,38 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-from lib.ui import set_app_config, sidebar_user_card
+from lib.ui import (
+    attribution_panel,
+    begin_stage_timing,
+    drift_panel,
+    model_quality_panel,
+    set_app_config,
+    sidebar_user_card,
+    stage_timing_panel,
+    whatif_panel,
+)
 from lib.auth import require_dataset_and_algo
-from lib.data import load_student_df
-from lib.models import train_model, predict_with_explanations
+from lib.instrument import stage
 
 set_app_config()
 sidebar_user_card()
 require_dataset_and_algo()
+timings = begin_stage_timing()
 
 if st.session_state["dataset"] != "student":
     st.warning("You selected Loan dataset. Please switch dataset on **Choose Dataset & Algorithm**.")
     st.stop()
 
+# data and model modules load pandas/sklearn; import them only once this page renders
+import pandas as pd
+
+from lib.data import fingerprint_df, load_student_df
+from lib.drift import get_monitor
+from lib.models import RESULT_CACHE, get_model, get_all_models, compare_predictions, predict_with_explanations
+from lib.registry import train_or_load
+
 st.title("Student Eligibility — XplainLab")
 
-df = load_student_df()
+df = load_student_df(compact=True)
 
 with st.expander("Preview sample student dataset"):
     st.dataframe(df, use_container_width=True)
@@ -28,9 +42,16 @@ mode = st.session_state["mode"]
 
 train_df = df.drop(columns=["Student_ID"])
 target = "Eligible"
-model_bundle = train_model(train_df, target_col=target, algo=algo)
+with stage("page.get_model"):
+    if st.session_state.get("tune"):
+        from lib.tuning import get_tuned_model
+
+        model_bundle = get_tuned_model(train_df, target_col=target, algo=algo, trainer=train_or_load)
+    else:
+        model_bundle = get_model(train_df, target_col=target, algo=algo, trainer=train_or_load)
 
 st.caption(f"Model: **{algo}** | Mode: **{mode}** | Rows used: {model_bundle['metrics']['n_rows']} | Holdout Accuracy: {model_bundle['metrics']['accuracy_holdout']}")
+model_quality_panel(model_bundle, train_df)
 
 st.subheader("1) Enter Student Details")
 
@@ -54,9 +75,11 @@ with st.form("student_form"):
         credits = st.number_input("Credits Completed", min_value=0.0, value=22.0, step=1.0)
         hosteller = st.selectbox("Hosteller", ["Yes", "No"])
 
+    compare = st.checkbox("Compare all algorithms side by side")
     submitted = st.form_submit_button("Get Prediction", type="primary")
 
 if not submitted:
+    stage_timing_panel(timings)
     st.stop()
 
 input_row = pd.DataFrame(
@@ -71,13 +94,30 @@ input_row = pd.DataFrame(
     }]
 )
 
-result = predict_with_explanations(model_bundle, input_row=input_row, algo=algo)
+neighbor_index = None
+if algo == "KNN":
+    from lib.neighbors import get_neighbor_index
+
+    try:
+        with stage("page.neighbor_index"):
+            neighbor_index = get_neighbor_index(model_bundle, df, id_col="Student_ID", target_col=target)
+    except ValueError:
+        neighbor_index = None
+
+result = predict_with_explanations(
+    model_bundle, input_row=input_row, algo=algo, neighbor_index=neighbor_index, cache=RESULT_CACHE
+)
+monitor = get_monitor(train_df, columns=model_bundle["X_cols"])
+monitor.update(input_row)
 
 pred = str(result["prediction"])
 eligible = pred.lower() == "yes"
 status_text = "ELIGIBLE ✅" if eligible else "NOT ELIGIBLE ❌"
 
-tabs = st.tabs(["2) Prediction Result", "3) Why? (Explanation)", "4) Visuals", "5) Explore Rules"])
+tab_names = ["2) Prediction Result", "3) Why? (Explanation)", "4) Visuals", "5) Explore Rules", "6) What-if"]
+if compare:
+    tab_names.append("7) Compare Algorithms")
+tabs = st.tabs(tab_names)
 
 with tabs[0]:
     st.subheader(status_text)
@@ -113,28 +153,78 @@ with tabs[1]:
     st.write(f"**Model-specific explainability ({algo}):**")
 
     if algo == "Decision Tree":
-        st.code(result["explanations"].get("tree_rules", "No rules."), language="text")
+        path = result["explanations"].get("decision_path")
+        if path:
+            st.write("Rules this input satisfied, from the root of the tree to its leaf:")
+            for cond in path["conditions"]:
+                st.write("- ", cond["rule"])
+        with st.expander("Full decision tree"):
+            st.code(result["explanations"].get("tree_rules", "No rules."), language="text")
     elif algo == "Logistic Regression":
         top = result["explanations"].get("top_contributions", [])
-        st.dataframe(pd.DataFrame(top), use_container_width=True) if top else st.write("No contribution data available.")
+        st.dataframe(pd.DataFrame(top).astype({"value": str}), use_container_width=True) if top else st.write("No contribution data available.")
     elif algo == "KNN":
-        st.write(result["explanations"].get("knn_neighbors", {}))
+        knn_info = result["explanations"].get("knn_neighbors", {})
+        if knn_info.get("neighbors"):
+            st.write("Most similar records in the training data:")
+            st.dataframe(
+                pd.DataFrame([{"distance": n["distance"], **n["record"]} for n in knn_info["neighbors"]]),
+                use_container_width=True,
+            )
+        else:
+            st.write(knn_info)
+
+    st.divider()
+    attribution_panel(model_bundle, input_row, train_df)
 
 with tabs[2]:
+    from lib.importance import get_importance, importance_frame
+    from lib.visuals import chart
+
     st.subheader("Visuals")
 
+    data_fp = fingerprint_df(df)
     c1, c2 = st.columns(2)
     with c1:
-        fig, ax = plt.subplots(figsize=(6, 4))
-        sns.countplot(data=df, x="Eligible", ax=ax)
-        ax.set_title("Eligibility Distribution (sample)")
-        st.pyplot(fig)
+        st.image(
+            chart(df, "count", x="Eligible", title="Eligibility Distribution (sample)", fingerprint=data_fp)
+        )
 
     with c2:
-        fig, ax = plt.subplots(figsize=(6, 4))
-        sns.scatterplot(data=df, x="Attendance", y="CGPA", hue="Eligible", ax=ax)
-        ax.set_title("Attendance vs CGPA (sample)")
-        st.pyplot(fig)
+        st.image(
+            chart(
+                df,
+                "scatter",
+                x="Attendance",
+                y="CGPA",
+                hue="Eligible",
+                title="Attendance vs CGPA (sample)",
+                fingerprint=data_fp,
+            )
+        )
+
+    st.write("**What drives this model overall** (drop in holdout accuracy when a column is shuffled):")
+    try:
+        importance = get_importance(model_bundle, train_df)
+    except ValueError as e:
+        st.write(str(e))
+    else:
+        st.bar_chart(importance_frame(importance).set_index("feature")["importance"])
+        st.caption(
+            f"Permutation importance over {importance['n_rows']} holdout rows, "
+            f"{importance['n_repeats']} shuffles per column (holdout accuracy {importance['baseline']:.3f})."
+        )
+
+with tabs[4]:
+    st.subheader("What-if explorer")
+    whatif_panel(model_bundle, input_row, train_df)
+
+if compare:
+    with tabs[5]:
+        st.subheader("All algorithms on this input")
+        combined = get_all_models(train_df, target_col=target)
+        st.dataframe(compare_predictions(combined, input_row), use_container_width=True)
+        st.caption("All models share the same preprocessing and the same 75/25 train/holdout split.")
 
 with tabs[3]:
     st.subheader("Explore Rules & Suggestions")
@@ -149,5 +239,8 @@ with tabs[3]:
         st.write("- Compare results across algorithms.")
         from lib.auth import go_choose
 
+drift_panel(monitor)
+stage_timing_panel(timings)
+
 if st.session_state["dataset"] != "student":
     go_choose()
\ No newline at end of file
@@ -3,11 +3,33 @@ from lib.ui import set_app_config, sidebar_user_card
 from lib.auth import require_login
 import sys
 import os
+import threading
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 set_app_config()
 
+
+@st.cache_resource
+def _warm_start() -> threading.Thread:
+    # once per server process, in the background so this page renders at once:
+    # import sklearn and load (or fit and save) the default bundles into the
+    # shared model cache while the first visitor is still logging in, then
+    # import the plotting stack the Visuals tab needs
+    def _run():
+        from lib.registry import prewarm
+
+        prewarm()
+        import lib.visuals  # noqa: F401
+        import seaborn  # noqa: F401
+
+    thread = threading.Thread(target=_run, name="xplainlab-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+_warm_start()
+
 st.title("XplainLab")
 st.caption("Transparent ML decisions for Loan Eligibility + Student Eligibility (Decision Tree, KNN, Logistic Regression).")
 
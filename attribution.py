@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from math import comb, factorial
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+from lib.instrument import stage
+from lib.models import feature_sources, training_rows
+from lib.whatif import positive_index
+
+
+# background rows are summarized to at most this many weighted k-means centroids
+BACKGROUND_CENTROIDS = 10
+# coalitions per row for KernelSHAP; with few features every coalition is enumerated
+KERNEL_SAMPLES = 512
+# rows per masked-evaluation block (rows x coalitions x centroids x features floats)
+KERNEL_BLOCK = 16
+MAX_CACHED = 32
+
+
+class Background:
+    """
+    Training data of one model version, summarized once: the transformed
+    mean (linear baseline) and weighted k-means centroids (KernelSHAP).
+    """
+
+    def __init__(self, model_bundle: dict, df: pd.DataFrame, n_centroids: int = BACKGROUND_CENTROIDS):
+        if "train_index" not in model_bundle:
+            raise ValueError("Bundle has no train_index; retrain it to compute attributions.")
+        pre = model_bundle["pipeline"].named_steps["pre"]
+        Xt = pre.transform(training_rows(model_bundle, df)[model_bundle["X_cols"]])
+        self.version = model_bundle.get("version")
+        self.mean = np.asarray(Xt.mean(axis=0), dtype=np.float64).ravel()
+
+        X = Xt.toarray() if sp.issparse(Xt) else np.asarray(Xt, dtype=np.float64)
+        k = min(n_centroids, len(X))
+        if len(np.unique(X, axis=0)) <= k:
+            self.centroids, counts = np.unique(X, axis=0, return_counts=True)
+        else:
+            km = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3).fit(X)
+            self.centroids = km.cluster_centers_
+            counts = np.bincount(km.labels_, minlength=k)
+        self.weights = counts / counts.sum()
+
+
+_BACKGROUNDS: OrderedDict[str, Background] = OrderedDict()
+_KERNEL_RESULTS: OrderedDict[tuple, tuple] = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _lru_get(cache: OrderedDict, key):
+    with _LOCK:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    return None
+
+
+def _lru_put(cache: OrderedDict, key, value, maxsize: int) -> None:
+    with _LOCK:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+
+def get_background(model_bundle: dict, df: pd.DataFrame) -> Background:
+    """
+    Background summary for a model version, built on first use.
+    """
+    key = model_bundle.get("version") or str(id(model_bundle["pipeline"]))
+    bg = _lru_get(_BACKGROUNDS, key)
+    if bg is None:
+        bg = Background(model_bundle, df)
+        _lru_put(_BACKGROUNDS, key, bg, MAX_CACHED)
+    return bg
+
+
+def _groups(model_bundle: dict) -> np.ndarray:
+    # transformed column -> position of its source column in X_cols
+    pos = {c: i for i, c in enumerate(model_bundle["X_cols"])}
+    return np.asarray([pos[src[1]] for src in feature_sources(model_bundle)], dtype=np.intp)
+
+
+def _to_columns(phi: np.ndarray, groups: np.ndarray, n_cols: int) -> np.ndarray:
+    # sum transformed-space attributions per original column (one-hot blocks add up)
+    out = np.zeros((phi.shape[0], n_cols))
+    np.add.at(out.T, groups, phi.T)
+    return out
+
+
+def _dense_columns(Xt, cols) -> np.ndarray:
+    block = Xt[:, cols]
+    return block.toarray() if sp.issparse(block) else np.asarray(block, dtype=np.float64)
+
+
+# --- trees
+
+
+def _tree_paths(tree: DecisionTreeClassifier, k: int) -> list[tuple]:
+    """
+    Per leaf: (value, features, lower bounds, upper bounds, cover fractions).
+    Repeated splits on one feature along a path merge into one interval
+    lo < x <= hi whose cover fraction is the product of the split fractions.
+    """
+    t = tree.tree_
+    left, right = t.children_left, t.children_right
+    cover = t.weighted_n_node_samples
+    value = t.value[:, 0, :]
+    value = value[:, k] / value.sum(axis=1)
+
+    leaves = []
+    stack = [(0, {})]
+    while stack:
+        node, conds = stack.pop()
+        if left[node] == -1:
+            feats = sorted(conds)
+            leaves.append(
+                (
+                    float(value[node]),
+                    np.asarray(feats, dtype=np.intp),
+                    np.asarray([conds[f][0] for f in feats]),
+                    np.asarray([conds[f][1] for f in feats]),
+                    np.asarray([conds[f][2] for f in feats]),
+                )
+            )
+            continue
+        f, thr = int(t.feature[node]), float(t.threshold[node])
+        lo, hi, z = conds.get(f, (-np.inf, np.inf, 1.0))
+        for child, bounds in ((left[node], (lo, min(hi, thr))), (right[node], (max(lo, thr), hi))):
+            nxt = dict(conds)
+            nxt[f] = (*bounds, z * cover[child] / cover[node])
+            stack.append((child, nxt))
+    return leaves
+
+
+@lru_cache(maxsize=None)
+def _shapley_weights(d: int) -> np.ndarray:
+    # weight of a coalition of size s among d players, excluding the player itself
+    return np.asarray([factorial(s) * factorial(d - s - 1) / factorial(d) for s in range(d)])
+
+
+def tree_shap(tree: DecisionTreeClassifier, Xt, k: int) -> tuple[float, np.ndarray]:
+    """
+    Exact path-dependent TreeSHAP for one tree, all rows at once.
+
+    Each leaf contributes value * prod_u (o_u if u in S else z_u) to v(S), where
+    o_u(x) says whether x satisfies the leaf's interval on feature u and z_u is
+    the cover fraction. The Shapley sum over subsets of the other path features
+    is read off the coefficients of prod_j (z_j + o_j t), so a leaf costs
+    O(d^2) vector ops for d distinct features on its path.
+
+    Returns (expected value, phi of shape (n_rows, n_transformed_features)).
+    """
+    n = Xt.shape[0]
+    phi = np.zeros((n, Xt.shape[1]))
+    base = 0.0
+    for value, feats, lo, hi, z in _tree_paths(tree, k):
+        base += value * float(np.prod(z))
+        d = len(feats)
+        if d == 0:
+            continue
+        x = _dense_columns(Xt, feats)
+        o = ((x > lo) & (x <= hi)).astype(np.float64)
+        w = _shapley_weights(d)
+        for i in range(d):
+            poly = np.ones((n, 1))
+            for j in range(d):
+                if j == i:
+                    continue
+                nxt = np.zeros((n, poly.shape[1] + 1))
+                nxt[:, :-1] += poly * z[j]
+                nxt[:, 1:] += poly * o[:, j : j + 1]
+                poly = nxt
+            phi[:, feats[i]] += value * (o[:, i] - z[i]) * (poly @ w)
+    return base, phi
+
+
+# --- linear models
+
+
+def linear_shap(model, Xt, mean: np.ndarray, k: int) -> tuple[float, np.ndarray]:
+    """
+    Closed-form SHAP of the decision function (log-odds of class k) against
+    the training-mean baseline: phi_j = w_j * (x_j - mean_j).
+    """
+    coef = np.asarray(model.coef_, dtype=np.float64)
+    intercept = np.asarray(model.intercept_, dtype=np.float64)
+    if coef.shape[0] == 1:
+        sign = 1.0 if k == 1 else -1.0
+        w, b = sign * coef[0], sign * intercept[0]
+    else:
+        w, b = coef[k], intercept[k]
+    if sp.issparse(Xt):
+        phi = np.asarray(Xt.multiply(w).toarray()) - w * mean
+    else:
+        phi = (np.asarray(Xt, dtype=np.float64) - mean) * w
+    return float(w @ mean + b), phi
+
+
+# --- model-agnostic (KNN)
+
+
+def _comb(n: int, ks: np.ndarray) -> np.ndarray:
+    return np.asarray([comb(n, int(k)) for k in ks], dtype=np.float64)
+
+
+@lru_cache(maxsize=16)
+def _coalitions(d: int, nsamples: int, seed: int = 42) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Coalition masks (m, d) and Shapley-kernel weights, excluding the empty
+    and full sets. Every coalition is used when 2^d - 2 <= nsamples; otherwise
+    sizes are drawn in proportion to their total kernel weight and members
+    uniformly within a size.
+    """
+    sizes = np.arange(1, d)
+    size_weight = (d - 1) / (sizes * (d - sizes))
+    if 2**d - 2 <= nsamples:
+        masks = ((np.arange(1, 2**d - 1)[:, None] >> np.arange(d)) & 1).astype(bool)
+        s = masks.sum(axis=1)
+        weights = (d - 1) / (_comb(d, s) * s * (d - s))
+        return masks, weights
+    rng = np.random.default_rng(seed)
+    p = size_weight / size_weight.sum()
+    drawn = rng.choice(sizes, size=nsamples, p=p)
+    masks = np.zeros((nsamples, d), dtype=bool)
+    for r, s in enumerate(drawn):
+        masks[r, rng.choice(d, size=s, replace=False)] = True
+    # sampled in proportion to the kernel, so rows are equally weighted
+    return masks, np.full(nsamples, 1.0 / nsamples)
+
+
+def kernel_shap(model, Xt, background: Background, groups: np.ndarray, k: int, nsamples: int = KERNEL_SAMPLES):
+    """
+    KernelSHAP over original columns (one-hot blocks switch together) for
+    predict_proba[:, k]. Absent columns take background centroid values; the
+    weighted least squares is solved for every row in one lstsq call.
+
+    Returns (expected value, phi of shape (n_rows, n_columns)).
+    """
+    X = Xt.toarray() if sp.issparse(Xt) else np.asarray(Xt, dtype=np.float64)
+    n, d = len(X), int(groups.max()) + 1
+    C, cw = background.centroids, background.weights
+    base = float(model.predict_proba(C)[:, k] @ cw)
+    fx = model.predict_proba(X)[:, k]
+
+    masks, weights = _coalitions(d, nsamples)
+    colmask = masks[:, groups]  # (m, n_features)
+    m = len(masks)
+
+    y = np.empty((n, m))
+    for start in range(0, n, KERNEL_BLOCK):
+        xb = X[start : start + KERNEL_BLOCK]
+        # (rows, coalitions, centroids, features)
+        Z = np.where(colmask[None, :, None, :], xb[:, None, None, :], C[None, None, :, :])
+        p = model.predict_proba(Z.reshape(-1, X.shape[1]))[:, k].reshape(len(xb), m, len(C))
+        y[start : start + len(xb)] = p @ cw
+
+    # sum(phi) == fx - base: eliminate the last column, then weighted least squares
+    Zm = masks.astype(np.float64)
+    A = Zm[:, :-1] - Zm[:, -1:]
+    rhs = (y - base).T - np.outer(Zm[:, -1], fx - base)
+    sw = np.sqrt(weights)[:, None]
+    sol = np.linalg.lstsq(A * sw, rhs * sw, rcond=None)[0].T
+    phi = np.column_stack([sol, (fx - base) - sol.sum(axis=1)])
+    return base, phi
+
+
+def _row_key(version, Xt, nsamples: int) -> tuple:
+    X = Xt.toarray() if sp.issparse(Xt) else np.ascontiguousarray(Xt, dtype=np.float64)
+    return (version, nsamples, hashlib.sha256(X.tobytes()).hexdigest())
+
+
+# --- entry point
+
+
+def explain(
+    model_bundle: dict,
+    X: pd.DataFrame,
+    df: pd.DataFrame,
+    positive_class=None,
+    nsamples: int = KERNEL_SAMPLES,
+) -> dict:
+    """
+    SHAP attributions of every row of X, summed per original column.
+
+      - Decision Tree: exact TreeSHAP of P(positive_class)
+      - Logistic Regression: linear SHAP of the log-odds against the
+        training-mean baseline
+      - anything else (KNN): KernelSHAP of P(positive_class) against k-means
+        background centroids; results are cached per model version and input
+
+    df is the training frame the bundle was fitted on (train_index rows are
+    used); it is summarized once per model version.
+
+    Returns dict with features (X_cols), values (n_rows, n_columns),
+    base_value, output ("probability" or "log-odds"), method and
+    positive_class. base_value + values.sum(axis=1) equals the model output.
+    """
+    pipe = model_bundle["pipeline"]
+    model = pipe.named_steps["model"]
+    cols = model_bundle["X_cols"]
+    k = positive_index(model.classes_, positive_class)
+    groups = _groups(model_bundle)
+
+    with stage("attribution.preprocess"):
+        Xt = pipe.named_steps["pre"].transform(X[cols])
+
+    with stage("attribution.explain"):
+        if isinstance(model, DecisionTreeClassifier):
+            base, phi = tree_shap(model, Xt, k)
+            values, method, output = _to_columns(phi, groups, len(cols)), "tree", "probability"
+        elif isinstance(model, (LogisticRegression, SGDClassifier)):
+            base, phi = linear_shap(model, Xt, get_background(model_bundle, df).mean, k)
+            values, method, output = _to_columns(phi, groups, len(cols)), "linear", "log-odds"
+        else:
+            key = _row_key(model_bundle.get("version"), Xt, nsamples) + (k,)
+            hit = _lru_get(_KERNEL_RESULTS, key)
+            if hit is None:
+                hit = kernel_shap(model, Xt, get_background(model_bundle, df), groups, k, nsamples)
+                _lru_put(_KERNEL_RESULTS, key, hit, 1024)
+            base, values = hit
+            method, output = "kernel", "probability"
+
+    classes = model.classes_
+    return {
+        "features": list(cols),
+        "values": values,
+        "base_value": base,
+        "output": output,
+        "method": method,
+        "positive_class": classes[k].item() if isinstance(classes[k], np.generic) else classes[k],
+    }
+
+
+def attribution_table(result: dict, X: pd.DataFrame, row: int = 0) -> pd.DataFrame:
+    """
+    One row's attributions next to its input values, largest magnitude first.
+    """
+    vals = result["values"][row]
+    out = pd.DataFrame(
+        {
+            "feature": result["features"],
+            "value": [str(X.iloc[row][c]) for c in result["features"]],
+            "attribution": vals,
+        }
+    )
+    return out.reindex(np.argsort(-np.abs(vals), kind="stable")).reset_index(drop=True)
@@ -12,6 +12,7 @@ def init_auth_state():
     st.session_state.setdefault("dataset", None)  # "loan" or "student"
     st.session_state.setdefault("algorithm", None)  # "Decision Tree" | "KNN" | "Logistic Regression"
     st.session_state.setdefault("mode", "Beginner")  # Beginner | Expert
+    st.session_state.setdefault("tune", False)  # cross-validated hyperparameter search
 
 def _switch_page(path: str):
     """
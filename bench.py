@@ -0,0 +1,247 @@
+"""
+Benchmarks for training, inference and explanations across data sizes.
+
+    python -m lib.bench run --max-rows 100000 --out bench.json
+    python -m lib.bench compare bench.json baseline.json --threshold 0.25
+
+`run` times every stage for every dataset x algorithm x size and writes JSON.
+`compare` exits with status 1 if any stage got slower than the baseline by
+more than the threshold (0.25 = 25%).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from lib.data import DATASET_SCHEMAS, compact_df, sample_df
+from lib.models import (
+    ALGORITHMS,
+    clear_caches,
+    predict_batch,
+    predict_with_explanations,
+    train_model,
+    tree_rules_text,
+)
+
+
+SIZES = [10**2, 10**3, 10**4, 10**5, 10**6, 10**7]
+
+# rows scored by the batch / explanation stages; fit uses the full size
+SCORE_ROWS = 1_000
+
+# KNN's holdout accuracy in train_model is quadratic in rows; larger sizes
+# are skipped unless asked for
+KNN_MAX_ROWS = 10**5
+
+# continuous columns get multiplicative noise so synthetic rows are not exact copies
+JITTER = {
+    "loan": ["ApplicantIncome", "CoapplicantIncome", "LoanAmount"],
+    "student": ["Attendance", "CGPA"],
+}
+
+
+def synth_dataset(name: str, n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    n synthetic rows following the loan/student schema.
+
+    Rows are resampled from the embedded sample, so column joint structure,
+    category frequencies and missing-value patterns carry over; continuous
+    columns are jittered by +/-15% and IDs are regenerated. Categoricals are
+    built from codes, so 10^7 rows stay affordable.
+    """
+    schema = DATASET_SCHEMAS[name]
+    base = compact_df(sample_df(name), schema)
+    rng = np.random.default_rng(seed)
+    pick = rng.integers(0, len(base), size=n)
+
+    prefix = name[:3].upper()
+    out = {schema.id_col: [f"{prefix}{i:08d}" for i in range(n)]}
+    for col in base.columns:
+        if col == schema.id_col:
+            continue
+        s = base[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            out[col] = pd.Categorical.from_codes(s.cat.codes.to_numpy()[pick], dtype=s.dtype)
+        else:
+            values = s.to_numpy()[pick]
+            if col in JITTER[name]:
+                values = (values * rng.uniform(0.85, 1.15, size=n)).astype(values.dtype)
+            out[col] = values
+    return pd.DataFrame(out)
+
+
+def _measure(fn, repeat: int = 1, memory: bool = True) -> tuple[float, float | None]:
+    """
+    (best seconds over `repeat` untraced runs, peak traced MiB of one extra run)
+
+    tracemalloc slows allocation-heavy code severalfold, so timings never run
+    under it; memory=False skips the traced run.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    if not memory:
+        return best, None
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2**20
+
+
+def _cold_tree_rules(bundle: dict) -> str:
+    # tree_rules_text memoizes per version; time the render, not the lookup
+    clear_caches()
+    return tree_rules_text(bundle)
+
+
+def bench_one(name: str, algo: str, n: int, seed: int = 0, memory: bool = True) -> list[dict]:
+    schema = DATASET_SCHEMAS[name]
+    df = synth_dataset(name, n, seed)
+    train_df = df.drop(columns=[schema.id_col])
+    X = train_df.drop(columns=[schema.target_col])
+    score = X.iloc[: min(SCORE_ROWS, len(X))]
+    one = X.iloc[[0]]
+
+    bundle = {}
+
+    def fit():
+        bundle.update(train_model(train_df, schema.target_col, algo))
+
+    stages = [("fit", fit, 1)]
+    stages.append(("predict_single", lambda: predict_with_explanations(bundle, one, algo), 5))
+    stages.append(("predict_batch", lambda: predict_batch(bundle, score, algo, explain=False), 3))
+    explain_stage = {
+        "Decision Tree": "explain_decision_path",
+        "KNN": "explain_neighbors",
+        "Logistic Regression": "explain_contributions",
+    }[algo]
+    stages.append((explain_stage, lambda: predict_batch(bundle, score, algo, explain=True), 3))
+    if algo == "Decision Tree":
+        stages.append(("explain_tree_rules", lambda: _cold_tree_rules(bundle), 3))
+
+    rows = []
+    for stage, fn, repeat in stages:
+        seconds, peak = _measure(fn, repeat, memory)
+        rows.append(
+            {
+                "dataset": name,
+                "algo": algo,
+                "rows": n,
+                "stage": stage,
+                "seconds": round(seconds, 6),
+                "peak_mb": None if peak is None else round(peak, 3),
+            }
+        )
+    return rows
+
+
+def run(
+    sizes=None,
+    datasets=("loan", "student"),
+    algos=ALGORITHMS,
+    seed: int = 0,
+    memory: bool = True,
+    knn_max_rows: int = KNN_MAX_ROWS,
+    verbose: bool = True,
+) -> dict:
+    import sklearn
+
+    results = []
+    for n in sizes or SIZES:
+        for name in datasets:
+            for algo in algos:
+                if algo == "KNN" and n > knn_max_rows:
+                    continue
+                rows = bench_one(name, algo, n, seed, memory)
+                results.extend(rows)
+                if verbose:
+                    summary = " ".join(f"{r['stage']}={r['seconds'] * 1e3:.1f}ms" for r in rows)
+                    print(f"{name:8s} {algo:20s} n={n:<9d} {summary}", flush=True)
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+            "seed": seed,
+            "score_rows": SCORE_ROWS,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.25, min_seconds: float = 1e-3) -> list[dict]:
+    """
+    Stages slower than baseline * (1 + threshold). Stages faster than
+    min_seconds in the baseline are ignored as timer noise.
+    """
+    key = lambda r: (r["dataset"], r["algo"], r["rows"], r["stage"])  # noqa: E731
+    base = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = base.get(key(r))
+        if b is None or b["seconds"] < min_seconds:
+            continue
+        ratio = r["seconds"] / b["seconds"]
+        if ratio > 1 + threshold:
+            regressions.append({**r, "baseline_seconds": b["seconds"], "ratio": round(ratio, 3)})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m lib.bench")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run", help="run the benchmark matrix")
+    r.add_argument("--max-rows", type=float, default=1e5, help="largest size to run (sizes are powers of ten from 100)")
+    r.add_argument("--datasets", nargs="+", default=["loan", "student"], choices=list(DATASET_SCHEMAS))
+    r.add_argument("--algos", nargs="+", default=ALGORITHMS, choices=ALGORITHMS)
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("--knn-max-rows", type=float, default=KNN_MAX_ROWS)
+    r.add_argument("--no-memory", action="store_true", help="skip the traced run per stage")
+    r.add_argument("--out", default="bench.json")
+
+    c = sub.add_parser("compare", help="compare a run against a baseline")
+    c.add_argument("current")
+    c.add_argument("baseline")
+    c.add_argument("--threshold", type=float, default=0.25)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "run":
+        sizes = [n for n in SIZES if n <= args.max_rows]
+        res = run(sizes, tuple(args.datasets), args.algos, args.seed, not args.no_memory, int(args.knn_max_rows))
+        with open(args.out, "w") as f:
+            json.dump(res, f, indent=2)
+        print(f"wrote {len(res['results'])} results to {args.out}")
+        return 0
+
+    with open(args.current) as f:
+        current = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.threshold)
+    for reg in regressions:
+        print(
+            f"REGRESSION {reg['dataset']}/{reg['algo']} n={reg['rows']} {reg['stage']}: "
+            f"{reg['baseline_seconds']:.4f}s -> {reg['seconds']:.4f}s (x{reg['ratio']})"
+        )
+    print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
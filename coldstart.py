@@ -0,0 +1,201 @@
+"""
+Cold-start measurements for the Streamlit app: every scenario runs in a
+fresh interpreter with an empty model registry, so imports, data loading
+and model fits are all paid again.
+
+    python -m lib.coldstart run --repeat 3 --out coldstart.json
+    python -m lib.coldstart imports
+
+`run` renders pages with streamlit.testing.AppTest and reports the wall time
+of each script run plus which heavy packages were imported by the end.
+`imports` times `import lib.<module>` on its own for every library module.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+# directory holding app.py, pages/ and lib/
+APP_DIR = Path(__file__).absolute().parent.parent
+
+HEAVY = ("pandas", "scipy", "sklearn", "matplotlib", "seaborn", "pyarrow")
+
+MODULES = (
+    "auth", "ui", "instrument", "data", "models", "registry", "neighbors", "tuning",
+    "visuals", "whatif", "attribution", "importance",
+)
+
+LOGGED_IN = {"logged_in": True, "name": "Bench", "email": "bench@example.com", "role": "Loan Applicant"}
+
+# name -> steps; each step renders a script (optionally clicking a button first)
+# or waits for the background prewarm started by app.py
+SCENARIOS = {
+    "app_logged_out": [{"script": "app.py"}],
+    "login": [{"script": "pages/1_Login.py"}],
+    "choose": [{"script": "pages/2_Choose_Dataset_Algorithm.py", "state": LOGGED_IN}],
+    "loan_wrong_dataset": [
+        {"script": "pages/3_Loan_Applicant.py", "state": {**LOGGED_IN, "dataset": "student", "algorithm": "KNN"}}
+    ],
+    "loan_form": [
+        {"script": "pages/3_Loan_Applicant.py", "state": {**LOGGED_IN, "dataset": "loan", "algorithm": "KNN"}}
+    ],
+    "loan_submit": [
+        {"script": "pages/3_Loan_Applicant.py", "state": {**LOGGED_IN, "dataset": "loan", "algorithm": "KNN"}},
+        {"click": "Get Prediction"},
+    ],
+    "prewarmed_loan_submit": [
+        {"script": "app.py", "state": LOGGED_IN},
+        {"prewarm": 120.0},
+        {"script": "pages/3_Loan_Applicant.py", "state": {**LOGGED_IN, "dataset": "loan", "algorithm": "KNN"}},
+        {"click": "Get Prediction"},
+    ],
+}
+
+
+def _heavy_loaded() -> list[str]:
+    return [m for m in HEAVY if m in sys.modules]
+
+
+def _worker(steps: list[dict]) -> dict:
+    # runs inside the child interpreter; AppTest itself is imported before timing
+    import threading
+
+    from streamlit.testing.v1 import AppTest
+
+    out = []
+    at = None
+    for step in steps:
+        t0 = time.perf_counter()
+        if "prewarm" in step:
+            for t in threading.enumerate():
+                if t.name == "xplainlab-prewarm":
+                    t.join(step["prewarm"])
+            name = "prewarm"
+        elif "click" in step:
+            next(b for b in at.button if b.label == step["click"]).click()
+            at.run()
+            name = f"click {step['click']}"
+        else:
+            at = AppTest.from_file(str(APP_DIR / step["script"]), default_timeout=600)
+            for k, v in step.get("state", {}).items():
+                at.session_state[k] = v
+            at.run()
+            name = step["script"]
+        out.append(
+            {
+                "step": name,
+                "seconds": time.perf_counter() - t0,
+                "exceptions": [] if at is None else [str(e.value)[:200] for e in at.exception],
+            }
+        )
+    return {"steps": out, "heavy_modules": _heavy_loaded()}
+
+
+def _spawn(args: list[str], registry: str | None) -> dict:
+    env = dict(os.environ)
+    env["XPLAINLAB_REGISTRY_DIR"] = registry or tempfile.mkdtemp(prefix="xplainlab-coldstart-")
+    proc = subprocess.run(
+        [sys.executable, "-m", "lib.coldstart", *args],
+        cwd=APP_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "worker failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(scenarios: list[str], repeat: int = 3, registry: str | None = None) -> dict:
+    """
+    Median wall time per step over `repeat` fresh processes.
+    """
+    results = []
+    for name in scenarios:
+        runs = [_spawn(["_worker", json.dumps(SCENARIOS[name])], registry) for _ in range(repeat)]
+        steps = [
+            {
+                "step": s["step"],
+                "seconds": statistics.median(r["steps"][i]["seconds"] for r in runs),
+                "exceptions": s["exceptions"],
+            }
+            for i, s in enumerate(runs[0]["steps"])
+        ]
+        results.append({"scenario": name, "steps": steps, "heavy_modules": runs[0]["heavy_modules"]})
+        line = " ".join(f"{s['step']}={s['seconds'] * 1000:.0f}ms" for s in steps)
+        print(f"{name:24s} {line}  [{', '.join(runs[0]['heavy_modules']) or '-'}]", flush=True)
+        for s in steps:
+            for e in s["exceptions"]:
+                print(f"  ! {s['step']}: {e}", flush=True)
+    return {"meta": {"python": sys.version.split()[0], "repeat": repeat}, "results": results}
+
+
+def _import_worker(module: str) -> dict:
+    import streamlit  # noqa: F401  (every page has it; not part of the cost)
+
+    t0 = time.perf_counter()
+    __import__(f"lib.{module}")
+    return {"module": module, "seconds": time.perf_counter() - t0, "heavy_modules": _heavy_loaded()}
+
+
+def imports(modules=MODULES, repeat: int = 3) -> list[dict]:
+    """
+    Median time of importing each library module in a fresh interpreter.
+    """
+    rows = []
+    for m in modules:
+        runs = [_spawn(["_import_worker", m], None) for _ in range(repeat)]
+        row = {**runs[0], "seconds": statistics.median(r["seconds"] for r in runs)}
+        rows.append(row)
+        print(f"lib.{m:14s} {row['seconds'] * 1000:7.0f}ms  [{', '.join(row['heavy_modules']) or '-'}]", flush=True)
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m lib.coldstart")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run", help="render pages in fresh processes")
+    r.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    r.add_argument("--repeat", type=int, default=3)
+    r.add_argument("--registry", help="reuse this model registry instead of a fresh empty one per process")
+    r.add_argument("--out")
+
+    i = sub.add_parser("imports", help="time importing each library module")
+    i.add_argument("--modules", nargs="+", default=list(MODULES), choices=list(MODULES))
+    i.add_argument("--repeat", type=int, default=3)
+    i.add_argument("--out")
+
+    w = sub.add_parser("_worker")
+    w.add_argument("steps")
+    iw = sub.add_parser("_import_worker")
+    iw.add_argument("module")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "_worker":
+        print(json.dumps(_worker(json.loads(args.steps))))
+        return 0
+    if args.cmd == "_import_worker":
+        print(json.dumps(_import_worker(args.module)))
+        return 0
+
+    if args.cmd == "run":
+        res = run(args.scenarios, args.repeat, args.registry)
+    else:
+        res = {"meta": {"python": sys.version.split()[0], "repeat": args.repeat}, "results": imports(args.modules, args.repeat)}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(res, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,465 @@
+"""
+Post-fit compaction of train_model bundles.
+
+    model = compact_estimator(model, knn_storage="int8", probe=Xt[:256])
+    bundle_nbytes(bundle)
+
+KNN can keep its training matrix as float32 (or int8 codes with a per-column
+offset and step) instead of a float64 copy plus a KD/ball tree, and answers
+queries by blocked brute force. Decision trees swap sklearn's node structs
+for plain arrays in the smallest integer types that fit and drop impurities,
+which only fitting uses. Both stay drop-in estimators: predict, predict_proba,
+kneighbors / apply / decision_path, tree_ and _fit_X read as before.
+
+Staying drop-in means overriding sklearn internals (KNN's _fit_X / _tree,
+the Tree object behind tree_), which move between minor releases. So
+compaction only runs on the sklearn versions in SKLEARN_RANGE, and when
+probe rows are given the compact estimator must match the sklearn one on
+them; otherwise the plain estimator is kept.
+"""
+from __future__ import annotations
+
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+import sklearn
+
+from sklearn.metrics import pairwise_distances
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.utils import check_array
+from sklearn.utils.extmath import row_norms, safe_sparse_dot
+
+from lib.models import KNN_STORAGE, KNN_STORAGES
+
+# training rows dequantized and compared per step, and query rows per step
+BLOCK_ROWS = 8192
+QUERY_ROWS = 512
+
+# sklearn versions whose KNN / Tree internals the compact estimators were
+# checked against: [first, last) as (major, minor)
+SKLEARN_RANGE = ((1, 3), (1, 10))
+# rows train_model passes to the parity check
+PROBE_ROWS = 256
+
+
+def sklearn_supported(version: str | None = None) -> bool:
+    major, minor = (int(p) for p in (version or sklearn.__version__).split(".")[:2])
+    return SKLEARN_RANGE[0] <= (major, minor) < SKLEARN_RANGE[1]
+
+
+def _smallest_int(lo: int, hi: int):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    return np.int64
+
+
+def _shrink(a: np.ndarray) -> np.ndarray:
+    a = np.asarray(a)
+    if not len(a):
+        return a.astype(np.int8)
+    return a.astype(_smallest_int(int(a.min()), int(a.max())))
+
+
+# --- KNN
+
+
+def _merge_below(best_d: np.ndarray, best_i: np.ndarray, D: np.ndarray, start: int) -> tuple:
+    """
+    Fold block D (columns are training rows start, start+1, ...) into the
+    current k best per row. Only entries below a row's current k-th best can
+    enter, and past the first block those are few, so this avoids
+    partitioning every block in full.
+    """
+    m, k = best_d.shape
+    bound = best_d.max(axis=1)
+    hit = np.flatnonzero(D.min(axis=1) < bound)
+    if not len(hit):
+        return best_d, best_i
+    rows, cols = np.nonzero(D[hit] < bound[hit, None])
+    rows = hit[rows]
+    all_r = np.concatenate([np.repeat(np.arange(m), k), rows])
+    all_d = np.concatenate([best_d.ravel(), D[rows, cols]])
+    all_i = np.concatenate([best_i.ravel(), cols + start])
+    order = np.lexsort((all_d, all_r))
+    first = np.concatenate([[0], np.cumsum(np.bincount(all_r, minlength=m))[:-1]])
+    take = order[first[:, None] + np.arange(k)[None, :]]
+    return all_d[take], all_i[take]
+
+
+class CompactKNeighborsClassifier(KNeighborsClassifier):
+    """
+    KNeighborsClassifier over a float32 or int8 training matrix.
+
+    Build one with from_fitted(); fit() also works and re-compacts, which is
+    how incremental.update_model refits it. storage is a constructor
+    parameter, so get_params() and clone() keep it.
+    """
+
+    def __init__(
+        self,
+        n_neighbors=5,
+        *,
+        weights="uniform",
+        algorithm="auto",
+        leaf_size=30,
+        p=2,
+        metric="minkowski",
+        metric_params=None,
+        n_jobs=None,
+        storage="float32",
+    ):
+        super().__init__(
+            n_neighbors=n_neighbors,
+            weights=weights,
+            algorithm=algorithm,
+            leaf_size=leaf_size,
+            p=p,
+            metric=metric,
+            metric_params=metric_params,
+            n_jobs=n_jobs,
+        )
+        self.storage = storage
+
+    @classmethod
+    def from_fitted(cls, knn: KNeighborsClassifier, storage: str = "float32") -> "CompactKNeighborsClassifier":
+        if getattr(knn, "outputs_2d_", False):
+            raise ValueError("Only single-output KNN can be compacted.")
+        new = cls.__new__(cls)
+        new.__dict__.update({k: v for k, v in knn.__dict__.items() if k not in ("_fit_X", "_tree")})
+        new.storage = storage
+        new._fit_X = knn._fit_X
+        new._tree = None
+        new._fit_method = "brute"
+        return new
+
+    @property
+    def _fit_X(self):
+        # sklearn compatibility only: this dequantizes the whole matrix into a
+        # new float64 copy on every read, so package code uses blocks() instead
+        return self._block(0, self.n_samples_fit_)
+
+    @_fit_X.setter
+    def _fit_X(self, X):
+        X = X.tocsr() if sp.issparse(X) else np.asarray(X)
+        if self.storage != "int8":
+            self._X_store = X.astype(np.float32)
+            self._X_lo = self._X_step = None
+            return
+        lo = np.asarray(X.min(axis=0).toarray() if sp.issparse(X) else X.min(axis=0), dtype=np.float64).ravel()
+        hi = np.asarray(X.max(axis=0).toarray() if sp.issparse(X) else X.max(axis=0), dtype=np.float64).ravel()
+        step = (hi - lo) / 255.0
+        step[step == 0] = 1.0
+        if sp.issparse(X):
+            # only stored values are quantized, so implicit zeros stay exact
+            codes = X.astype(np.int8)
+            codes.data = (np.rint((X.data - lo[X.indices]) / step[X.indices]) - 128).astype(np.int8)
+        else:
+            codes = (np.rint((X - lo) / step) - 128).astype(np.int8)
+        self._X_store, self._X_lo, self._X_step = codes, lo, step
+
+    def _block(self, start: int, stop: int):
+        B = self._X_store[start:stop]
+        if self._X_lo is None:
+            return B.astype(np.float64)
+        if sp.issparse(B):
+            B = B.astype(np.float64)
+            B.data = (B.data + 128.0) * self._X_step[B.indices] + self._X_lo[B.indices]
+            return B
+        return (B.astype(np.float64) + 128.0) * self._X_step + self._X_lo
+
+    def blocks(self, rows: int = BLOCK_ROWS):
+        """
+        (start, float64 block) pairs covering the training matrix in order,
+        dequantized a block at a time; the stored matrix is only read.
+        """
+        n_fit = self.n_samples_fit_
+        for start in range(0, n_fit, rows):
+            yield start, self._block(start, min(start + rows, n_fit))
+
+    def fit(self, X, y):
+        super().fit(X, y)
+        self._tree = None
+        self._fit_method = "brute"
+        return self
+
+    def kneighbors(self, X=None, n_neighbors=None, return_distance=True):
+        if X is None:
+            raise ValueError("CompactKNeighborsClassifier.kneighbors needs query rows X.")
+        k = int(n_neighbors or self.n_neighbors)
+        n_fit = self.n_samples_fit_
+        if k > n_fit:
+            raise ValueError(f"Expected n_neighbors <= n_samples_fit, but n_neighbors = {k}, n_samples_fit = {n_fit}")
+        X = check_array(X, accept_sparse="csr", dtype=np.float64)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, but {type(self).__name__} expects {self.n_features_in_}.")
+
+        euclidean = self.effective_metric_ == "euclidean"
+        chunks = [slice(q, q + QUERY_ROWS) for q in range(0, X.shape[0], QUERY_ROWS)]
+        best_d = [np.empty((X[c].shape[0], 0)) for c in chunks]
+        best_i = [np.empty((d.shape[0], 0), dtype=np.intp) for d in best_d]
+        # training blocks are the outer loop so each is dequantized once
+        for start, B in self.blocks():
+            if euclidean:
+                # ||b||^2 - 2 q.b ranks like the distance; ||q||^2 is added at the end
+                B_sq = row_norms(B, squared=True)[None, :]
+                B = B * -2.0
+            for j, c in enumerate(chunks):
+                if euclidean:
+                    D = safe_sparse_dot(X[c], B.T, dense_output=True)
+                    D += B_sq
+                else:
+                    D = pairwise_distances(X[c], B, metric=self.effective_metric_, **self.effective_metric_params_)
+                have = best_d[j].shape[1]
+                if have == k:
+                    best_d[j], best_i[j] = _merge_below(best_d[j], best_i[j], D, start)
+                    continue
+                if D.shape[1] > k - have:
+                    part = np.argpartition(D, k - have - 1, axis=1)[:, : k - have]
+                    D = np.take_along_axis(D, part, axis=1)
+                else:
+                    part = np.broadcast_to(np.arange(D.shape[1]), D.shape)
+                best_d[j] = np.hstack([best_d[j], D])
+                best_i[j] = np.hstack([best_i[j], part + start])
+
+        dist = np.empty((X.shape[0], k))
+        ind = np.empty((X.shape[0], k), dtype=np.intp)
+        for c, d, i in zip(chunks, best_d, best_i):
+            order = np.argsort(d, axis=1, kind="stable")
+            d = np.take_along_axis(d, order, axis=1)
+            if euclidean:
+                d = np.sqrt(np.maximum(d + row_norms(X[c], squared=True)[:, None], 0.0))
+            dist[c] = d
+            ind[c] = np.take_along_axis(i, order, axis=1)
+        return (dist, ind) if return_distance else ind
+
+    def predict_proba(self, X):
+        dist, ind = self.kneighbors(X)
+        if self.weights == "uniform":
+            w = np.ones_like(dist)
+        elif self.weights == "distance":
+            # as sklearn: exact matches take all the weight
+            with np.errstate(divide="ignore"):
+                w = 1.0 / dist
+            inf = np.isinf(w)
+            rows = inf.any(axis=1)
+            w[rows] = inf[rows]
+        else:
+            w = np.asarray(self.weights(dist), dtype=np.float64)
+        y = self._y[ind]
+        proba = np.zeros((len(ind), len(self.classes_)))
+        for c in range(len(self.classes_)):
+            proba[:, c] = (w * (y == c)).sum(axis=1)
+        total = proba.sum(axis=1, keepdims=True)
+        total[total == 0] = 1.0
+        return proba / total
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+# --- decision trees
+
+
+class CompactTree:
+    """
+    Array-only stand-in for sklearn's Tree with the attributes and methods
+    that DecisionTreeClassifier, export_text and this package read.
+    """
+
+    def __init__(self, tree):
+        self.node_count = int(tree.node_count)
+        self.n_features = int(tree.n_features)
+        self.n_outputs = int(tree.n_outputs)
+        self.n_classes = np.asarray(tree.n_classes).copy()
+        self.max_depth = int(tree.max_depth)
+        self.children_left = _shrink(tree.children_left)
+        self.children_right = _shrink(tree.children_right)
+        self.feature = _shrink(tree.feature)
+        self.threshold = np.asarray(tree.threshold, dtype=np.float64).copy()
+        self.missing_go_to_left = np.asarray(tree.missing_go_to_left, dtype=bool).copy()
+        self.value = np.asarray(tree.value).copy()
+        self.n_node_samples = _shrink(tree.n_node_samples)
+        weighted = np.asarray(tree.weighted_n_node_samples)
+        # unweighted fits: weighted counts are the plain counts, no need to keep both
+        self._weighted = None if np.array_equal(weighted, self.n_node_samples) else weighted.copy()
+
+    @property
+    def weighted_n_node_samples(self) -> np.ndarray:
+        return self.n_node_samples.astype(np.float64) if self._weighted is None else self._weighted
+
+    def _column(self, X, rows, cols) -> np.ndarray:
+        if sp.issparse(X):
+            return np.asarray(X[rows, cols]).ravel()
+        return X[rows, cols]
+
+    def _walk(self, X) -> list[np.ndarray]:
+        # nodes visited per depth level, -1 once a row has reached its leaf
+        n = X.shape[0]
+        node = np.zeros(n, dtype=np.intp)
+        levels = [node.copy()]
+        active = np.flatnonzero(self.children_left[node] != -1)
+        while len(active):
+            cur = node[active]
+            x = self._column(X, active, self.feature[cur].astype(np.intp))
+            go_left = np.where(np.isnan(x), self.missing_go_to_left[cur], x <= self.threshold[cur])
+            node[active] = np.where(go_left, self.children_left[cur], self.children_right[cur])
+            level = np.full(n, -1, dtype=np.intp)
+            level[active] = node[active]
+            levels.append(level)
+            active = active[self.children_left[node[active]] != -1]
+        return levels
+
+    def apply(self, X) -> np.ndarray:
+        levels = self._walk(X)
+        leaves = levels[0].copy()
+        for level in levels[1:]:
+            hit = level >= 0
+            leaves[hit] = level[hit]
+        return leaves
+
+    def predict(self, X) -> np.ndarray:
+        out = self.value.take(self.apply(X), axis=0)
+        return out.reshape(X.shape[0], -1) if self.n_outputs == 1 else out
+
+    def decision_path(self, X) -> sp.csr_matrix:
+        levels = np.stack(self._walk(X), axis=1)
+        mask = levels >= 0
+        indptr = np.concatenate([[0], np.cumsum(mask.sum(axis=1))])
+        data = np.ones(int(indptr[-1]), dtype=np.intp)
+        return sp.csr_matrix((data, levels[mask], indptr), shape=(X.shape[0], self.node_count))
+
+
+class CompactDecisionTreeClassifier(DecisionTreeClassifier):
+    """
+    DecisionTreeClassifier whose tree_ is a CompactTree. Feature importances
+    are computed before the impurities are dropped.
+    """
+
+    @classmethod
+    def from_fitted(cls, tree: DecisionTreeClassifier) -> "CompactDecisionTreeClassifier":
+        new = cls.__new__(cls)
+        new.__dict__.update(tree.__dict__)
+        new._feature_importances = tree.feature_importances_
+        new.tree_ = CompactTree(tree.tree_)
+        return new
+
+    @property
+    def feature_importances_(self) -> np.ndarray:
+        return self._feature_importances
+
+    def fit(self, *args, **kwargs):
+        raise TypeError("Compacted trees cannot be refitted; fit a DecisionTreeClassifier instead.")
+
+
+# --- parity
+
+
+def check_parity(model, compact, X) -> bool:
+    """
+    Whether a compact estimator answers like sklearn on the rows X.
+
+    Trees: predict_proba and apply must equal the original tree's. KNN: the
+    reference is a plain brute-force KNeighborsClassifier over the compact
+    model's (dequantized) training matrix, so quantization itself is not
+    counted; neighbour distances must agree, and predict_proba too wherever
+    the k-th neighbour is not tied with the next one.
+    """
+    if isinstance(compact, CompactDecisionTreeClassifier):
+        return np.array_equal(model.predict_proba(X), compact.predict_proba(X)) and np.array_equal(
+            model.apply(X), compact.apply(X)
+        )
+    if isinstance(compact, CompactKNeighborsClassifier):
+        params = {k: v for k, v in compact.get_params().items() if k != "storage"}
+        ref = KNeighborsClassifier(**{**params, "algorithm": "brute", "n_jobs": None})
+        ref.fit(compact._fit_X, compact.classes_[compact._y])
+        k = compact.n_neighbors
+        ref_dist, _ = ref.kneighbors(X, n_neighbors=min(k + 1, compact.n_samples_fit_))
+        dist, _ = compact.kneighbors(X)
+        if not np.allclose(dist, ref_dist[:, :k], rtol=1e-5, atol=1e-6):
+            return False
+        clear = np.ones(len(dist), dtype=bool)
+        if ref_dist.shape[1] > k:
+            clear = ~np.isclose(ref_dist[:, k - 1], ref_dist[:, k], rtol=1e-5, atol=1e-6)
+        return np.allclose(compact.predict_proba(X)[clear], ref.predict_proba(X)[clear])
+    return True
+
+
+# --- bundles
+
+
+def compact_estimator(model, knn_storage: str | None = None, probe=None):
+    """
+    The compact counterpart of a fitted estimator, or the estimator itself
+    when there is nothing to shrink (linear models, knn_storage="float64"),
+    when the installed sklearn is outside SKLEARN_RANGE, or when the compact
+    one fails check_parity on the probe rows (a warning is issued).
+    """
+    knn_storage = knn_storage or KNN_STORAGE
+    if knn_storage not in KNN_STORAGES:
+        raise ValueError(f"knn_storage must be one of {KNN_STORAGES}, not {knn_storage!r}")
+    if isinstance(model, (CompactKNeighborsClassifier, CompactDecisionTreeClassifier)):
+        return model
+    if not sklearn_supported():
+        return model
+    if isinstance(model, KNeighborsClassifier) and knn_storage != "float64":
+        compact = CompactKNeighborsClassifier.from_fitted(model, knn_storage)
+    elif isinstance(model, DecisionTreeClassifier):
+        compact = CompactDecisionTreeClassifier.from_fitted(model)
+    else:
+        return model
+    if probe is not None and probe.shape[0] and not check_parity(model, compact, probe):
+        warnings.warn(
+            f"{type(compact).__name__} does not match sklearn {sklearn.__version__}; keeping the plain estimator.",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+        return model
+    return compact
+
+
+def iter_arrays(obj, seen: dict | None = None):
+    """
+    Every ndarray reachable from obj through dicts, sequences, sparse
+    matrices, instance attributes and, for sklearn's Cython objects, their
+    pickled state. A plain Tree's state is a fresh copy of its nodes, so
+    those arrays are never memory-mapped; a KDTree's are its own arrays.
+    """
+    # seen maps id -> object, keeping temporary pickled states alive so
+    # their ids are not reused during the walk
+    seen = {} if seen is None else seen
+    if id(obj) in seen:
+        return
+    seen[id(obj)] = obj
+    if isinstance(obj, np.ndarray):
+        yield obj
+    elif sp.issparse(obj):
+        for a in (obj.data, obj.indices, obj.indptr):
+            yield from iter_arrays(a, seen)
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            yield from iter_arrays(v, seen)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            yield from iter_arrays(v, seen)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        for v in vars(obj).values():
+            yield from iter_arrays(v, seen)
+    elif type(obj).__module__.startswith("sklearn."):
+        # Cython objects (Tree, KDTree) expose their arrays only when pickled
+        try:
+            state = obj.__getstate__()
+        except TypeError:
+            return
+        yield from iter_arrays(state, seen)
+
+
+def bundle_nbytes(obj) -> int:
+    """
+    Bytes of the numpy arrays a bundle (or any object) holds, which is what
+    its saved size is made of. Sums array sizes without serializing anything.
+    """
+    return sum(a.nbytes for a in iter_arrays(obj))
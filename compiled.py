@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import math
+import time
+
+import numpy as np
+
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+from lib.compact import CompactKNeighborsClassifier
+
+
+class CompiledPredictor:
+    """
+    A fitted train_model bundle frozen into plain NumPy arrays.
+
+    Applies the same preprocessing as the ColumnTransformer (median/mode
+    imputation, standard scaling, one-hot with unknowns ignored) and the
+    same model maths, but on dicts or record arrays and with a single pass.
+    """
+
+    def __init__(self, model_bundle: dict):
+        pipe = model_bundle["pipeline"]
+        pre = pipe.named_steps["pre"]
+        model = pipe.named_steps["model"]
+
+        self.version = model_bundle.get("version")
+        self.classes = np.asarray(model.classes_)
+
+        # --- preprocessing tables
+        self.num_cols: list[str] = []
+        self.cat_cols: list[str] = []
+        self.num_fill = np.empty(0)
+        self.num_mean = np.empty(0)
+        self.num_scale = np.empty(0)
+        self.cat_fill: list = []
+        self.cat_maps: list[dict] = []
+        for name, trans, cols in pre.transformers_:
+            if name == "num" and len(cols):
+                self.num_cols = list(cols)
+                self.num_fill = trans.named_steps["imputer"].statistics_.astype(np.float64)
+                scaler = trans.named_steps["scaler"]
+                self.num_mean = scaler.mean_.astype(np.float64)
+                self.num_scale = scaler.scale_.astype(np.float64)
+            elif name == "cat" and len(cols):
+                self.cat_cols = list(cols)
+                self.cat_fill = list(trans.named_steps["imputer"].statistics_)
+                offset = len(self.num_cols)
+                for cats in trans.named_steps["onehot"].categories_:
+                    self.cat_maps.append({c: offset + j for j, c in enumerate(cats)})
+                    offset += len(cats)
+        self.n_features = len(self.num_cols) + sum(len(m) for m in self.cat_maps)
+
+        # --- model tables
+        if isinstance(model, DecisionTreeClassifier):
+            t = model.tree_
+            self.kind = "tree"
+            self.left = t.children_left.copy()
+            self.right = t.children_right.copy()
+            self.feature = t.feature.copy()
+            self.threshold = t.threshold.copy()
+            value = t.value[:, 0, :]
+            self.leaf_proba = value / value.sum(axis=1, keepdims=True)
+        elif isinstance(model, (LogisticRegression, SGDClassifier)):
+            self.kind = "linear"
+            # SGDClassifier normalises one-vs-rest sigmoids; LogisticRegression uses softmax
+            self.ovr = isinstance(model, SGDClassifier)
+            self.coef = model.coef_.astype(np.float64)
+            self.intercept = model.intercept_.astype(np.float64)
+        elif isinstance(model, KNeighborsClassifier):
+            if model.weights != "uniform" or model.effective_metric_ != "euclidean":
+                raise ValueError("Only uniform-weight euclidean KNN can be compiled.")
+            self.kind = "knn"
+            self.fit_y = np.asarray(model._y)
+            self.k = int(model.n_neighbors)
+            if isinstance(model, CompactKNeighborsClassifier):
+                # scored block by block from its float32 / int8 store, not a float64 copy
+                self.compact = model
+            else:
+                fit_X = model._fit_X
+                self.compact = None
+                self.fit_X = np.asarray(fit_X.toarray() if hasattr(fit_X, "toarray") else fit_X, dtype=np.float64)
+                self.fit_sq = np.einsum("ij,ij->i", self.fit_X, self.fit_X)
+        else:
+            raise ValueError(f"Cannot compile model of type {type(model).__name__}")
+
+    # --- preprocessing
+
+    def _column(self, records, col: str) -> list:
+        if isinstance(records, np.ndarray) and records.dtype.names:
+            return records[col].tolist()
+        return [r.get(col) for r in records]
+
+    def transform(self, records) -> np.ndarray:
+        """
+        records: a dict, a list of dicts, or a NumPy structured/record array.
+        """
+        if isinstance(records, dict):
+            records = [records]
+        n = len(records)
+        Xt = np.zeros((n, self.n_features), dtype=np.float64)
+
+        for j, col in enumerate(self.num_cols):
+            vals = np.array([np.nan if _is_missing(v) else float(v) for v in self._column(records, col)])
+            vals[np.isnan(vals)] = self.num_fill[j]
+            Xt[:, j] = (vals - self.num_mean[j]) / self.num_scale[j]
+
+        for j, col in enumerate(self.cat_cols):
+            lookup = self.cat_maps[j]
+            fill = self.cat_fill[j]
+            for r, v in enumerate(self._column(records, col)):
+                pos = lookup.get(fill if _is_missing(v) else v)
+                if pos is not None:
+                    Xt[r, pos] = 1.0
+        return Xt
+
+    # --- models
+
+    def _proba(self, Xt: np.ndarray) -> np.ndarray:
+        if self.kind == "tree":
+            node = np.zeros(len(Xt), dtype=np.intp)
+            rows = np.arange(len(Xt))
+            active = self.left[node] != -1
+            while active.any():
+                cur = node[active]
+                go_left = Xt[rows[active], self.feature[cur]] <= self.threshold[cur]
+                node[active] = np.where(go_left, self.left[cur], self.right[cur])
+                active = self.left[node] != -1
+            return self.leaf_proba[node]
+
+        if self.kind == "linear":
+            z = Xt @ self.coef.T + self.intercept
+            if z.shape[1] == 1:
+                p = 1.0 / (1.0 + np.exp(-z[:, 0]))
+                return np.column_stack([1.0 - p, p])
+            if self.ovr:
+                p = 1.0 / (1.0 + np.exp(-z))
+                return p / p.sum(axis=1, keepdims=True)
+            z -= z.max(axis=1, keepdims=True)
+            e = np.exp(z)
+            return e / e.sum(axis=1, keepdims=True)
+
+        if self.compact is not None:
+            return self.compact.predict_proba(Xt)
+
+        # knn: squared euclidean via ||a||^2 - 2ab + ||b||^2, then top-k votes
+        d2 = np.einsum("ij,ij->i", Xt, Xt)[:, None] - 2.0 * (Xt @ self.fit_X.T) + self.fit_sq[None, :]
+        k = min(self.k, self.fit_X.shape[0])
+        nn = np.argpartition(d2, k - 1, axis=1)[:, :k]
+        votes = self.fit_y[nn]
+        proba = np.zeros((len(Xt), len(self.classes)))
+        for c in range(len(self.classes)):
+            proba[:, c] = (votes == c).sum(axis=1)
+        return proba / k
+
+    def predict_proba(self, records) -> np.ndarray:
+        return self._proba(self.transform(records))
+
+    def predict(self, records) -> tuple:
+        """
+        Single record (dict): returns (label, proba).
+        Many records: returns (labels array, proba matrix).
+        """
+        proba = self.predict_proba(records)
+        labels = self.classes[np.argmax(proba, axis=1)]
+        if isinstance(records, dict):
+            return labels[0], proba[0]
+        return labels, proba
+
+
+def _is_missing(v) -> bool:
+    return v is None or (isinstance(v, float) and math.isnan(v))
+
+
+def compile_bundle(model_bundle: dict) -> CompiledPredictor:
+    return CompiledPredictor(model_bundle)
+
+
+def benchmark(model_bundle: dict, records: list[dict], repeat: int = 200) -> dict:
+    """
+    Compare the compiled predictor with the Pipeline path on single records:
+    checks predictions/probabilities agree and reports mean latency per call.
+    """
+    import pandas as pd
+
+    pipe = model_bundle["pipeline"]
+    compiled = compile_bundle(model_bundle)
+    X = pd.DataFrame(records)[model_bundle["X_cols"]]
+
+    ref_pred = pipe.predict(X)
+    ref_proba = pipe.predict_proba(X)
+    pred, proba = compiled.predict(records)
+
+    def _time(fn) -> float:
+        t0 = time.perf_counter()
+        for i in range(repeat):
+            fn(records[i % len(records)])
+        return (time.perf_counter() - t0) / repeat
+
+    def _pipeline_single(rec: dict):
+        row = pd.DataFrame([rec])[model_bundle["X_cols"]]
+        return pipe.predict(row)[0], pipe.predict_proba(row)[0]
+
+    pipeline_s = _time(_pipeline_single)
+    compiled_s = _time(compiled.predict)
+    return {
+        "predictions_match": float(np.mean(pred == ref_pred)),
+        "max_abs_proba_diff": float(np.max(np.abs(proba - ref_proba))),
+        "pipeline_ms": pipeline_s * 1e3,
+        "compiled_ms": compiled_s * 1e3,
+        "speedup": pipeline_s / compiled_s if compiled_s else None,
+    }
+
+
+if __name__ == "__main__":
+    from lib.data import load_loan_df, load_student_df
+    from lib.models import ALGORITHMS, train_model
+
+    for name, df, id_col, target in [
+        ("loan", load_loan_df(), "Loan_ID", "Loan_Status"),
+        ("student", load_student_df(), "Student_ID", "Eligible"),
+    ]:
+        train_df = df.drop(columns=[id_col])
+        X = train_df.drop(columns=[target])
+        records = X.astype(object).where(X.notna(), None).to_dict("records")
+        for algo in ALGORITHMS:
+            res = benchmark(train_model(train_df, target, algo), records)
+            print(
+                f"{name:8s} {algo:20s} match={res['predictions_match']:.3f} "
+                f"max|dp|={res['max_abs_proba_diff']:.2e} pipeline={res['pipeline_ms']:.3f}ms "
+                f"compiled={res['compiled_ms']:.3f}ms x{res['speedup']:.1f}"
+            )
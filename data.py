@@ -1,6 +1,25 @@
+from __future__ import annotations
+
+import hashlib
 import io
+import json
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 
+from lib.instrument import count, timed
+
+try:  # columnar cache is optional; without pyarrow files are parsed every time
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
 LOAN_CSV = """Loan_ID,Gender,Married,Dependents,Education,Self_Employed,ApplicantIncome,CoapplicantIncome,LoanAmount,Loan_Amount_Term,Credit_History,Property_Area,Loan_Status
 LP001002,Male,No,0,Graduate,No,5849,0,,360,1,Urban,Y
 LP001003,Male,Yes,1,Graduate,No,4583,1508,128,360,1,Rural,N
@@ -68,13 +87,306 @@ STU014,Female,70,7.0,1,22,IT,Yes,Yes
 STU015,Male,62,6.1,2,18,ME,No,No
 """
 
-def load_loan_df() -> pd.DataFrame:
-    df = pd.read_csv(io.StringIO(LOAN_CSV))
+# Explicit read dtypes for file-backed data. Dependents is read as text
+# because real loan books spell the top bucket "3+".
+LOAN_DTYPES = {
+    "Loan_ID": "object",
+    "Gender": "object",
+    "Married": "object",
+    "Dependents": "object",
+    "Education": "object",
+    "Self_Employed": "object",
+    "ApplicantIncome": "float64",
+    "CoapplicantIncome": "float64",
+    "LoanAmount": "float64",
+    "Loan_Amount_Term": "float64",
+    "Credit_History": "float64",
+    "Property_Area": "object",
+    "Loan_Status": "object",
+}
+
+STUDENT_DTYPES = {
+    "Student_ID": "object",
+    "Gender": "object",
+    "Attendance": "float64",
+    "CGPA": "float64",
+    "Backlogs": "float64",
+    "Credits_Completed": "float64",
+    "Department": "object",
+    "Hosteller": "object",
+    "Eligible": "object",
+}
+
+TARGET_VALUES = {
+    "loan": ("Loan_Status", {"Y", "N"}),
+    "student": ("Eligible", {"Yes", "No"}),
+}
+
+SCHEMAS = {"loan": LOAN_DTYPES, "student": STUDENT_DTYPES}
+
+@dataclass(frozen=True)
+class DatasetSchema:
+    """
+    Column roles for a dataset. `numeric` maps each numeric column to the
+    smallest dtype it is stored in when it has no missing values; columns
+    with gaps fall back to float32.
+    """
+    name: str
+    id_col: str
+    target_col: str
+    categorical: tuple
+    numeric: dict = field(default_factory=dict)
+
+    @property
+    def feature_cols(self) -> list:
+        return [*self.categorical, *self.numeric]
+
+LOAN_SCHEMA = DatasetSchema(
+    name="loan",
+    id_col="Loan_ID",
+    target_col="Loan_Status",
+    categorical=("Gender", "Married", "Education", "Self_Employed", "Property_Area"),
+    numeric={
+        "Dependents": "int8",
+        "ApplicantIncome": "float32",
+        "CoapplicantIncome": "float32",
+        "LoanAmount": "float32",
+        "Loan_Amount_Term": "int16",
+        "Credit_History": "int8",
+    },
+)
+
+STUDENT_SCHEMA = DatasetSchema(
+    name="student",
+    id_col="Student_ID",
+    target_col="Eligible",
+    categorical=("Gender", "Department", "Hosteller"),
+    numeric={
+        "Attendance": "float32",
+        "CGPA": "float32",
+        "Backlogs": "int8",
+        "Credits_Completed": "int16",
+    },
+)
+
+DATASET_SCHEMAS = {"loan": LOAN_SCHEMA, "student": STUDENT_SCHEMA}
+
+def schema_for_columns(columns) -> DatasetSchema | None:
+    """
+    The schema whose feature columns are exactly `columns` (any order), if any.
+    """
+    cols = set(columns)
+    for schema in DATASET_SCHEMAS.values():
+        if set(schema.feature_cols) == cols:
+            return schema
+    return None
+
+# bump when the cached layout or normalisation changes
+CACHE_FORMAT = 1
+DATA_CACHE_DIR = Path(
+    os.environ.get("XPLAINLAB_DATA_CACHE", Path(__file__).resolve().parent.parent / ".data_cache")
+)
+
+def fingerprint_df(df: pd.DataFrame) -> str:
+    """
+    Content hash of a DataFrame (values, index, column names and dtypes).
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+@lru_cache(maxsize=None)
+def _parse_embedded(csv_text: str) -> pd.DataFrame:
+    df = pd.read_csv(io.StringIO(csv_text))
     # normalize blanks to NaN
-    df = df.replace({"": None})
-    return df
+    return df.replace({"": None})
+
+def sample_df(name: str) -> pd.DataFrame:
+    """
+    The embedded loan/student sample, ignoring XPLAINLAB_*_CSV overrides.
+    """
+    return _parse_embedded(LOAN_CSV if name == "loan" else STUDENT_CSV).copy()
+
+def clear_caches() -> None:
+    """
+    Drop the parsed embedded samples; the next load parses them again.
+    """
+    _parse_embedded.cache_clear()
+
+@timed("data.load_loan_df")
+def load_loan_df(compact: bool = False) -> pd.DataFrame:
+    path = os.environ.get("XPLAINLAB_LOAN_CSV")
+    df = load_loan_csv(path) if path else _parse_embedded(LOAN_CSV).copy()
+    return compact_df(df, LOAN_SCHEMA) if compact else df
+
+@timed("data.load_student_df")
+def load_student_df(compact: bool = False) -> pd.DataFrame:
+    path = os.environ.get("XPLAINLAB_STUDENT_CSV")
+    df = load_student_csv(path) if path else _parse_embedded(STUDENT_CSV).copy()
+    return compact_df(df, STUDENT_SCHEMA) if compact else df
+
+def _compact_numeric(s: pd.Series, dtype: str) -> pd.Series:
+    values = pd.to_numeric(s, errors="coerce")
+    if np.dtype(dtype).kind == "i":
+        info = np.iinfo(dtype)
+        ok = (
+            values.notna().all()
+            and (values == np.floor(values)).all()
+            and (len(values) == 0 or (values.min() >= info.min and values.max() <= info.max))
+        )
+        if not ok:
+            return values.astype("float32")
+    return values.astype(dtype)
+
+@timed("data.compact_df")
+def compact_df(df: pd.DataFrame, schema: DatasetSchema) -> pd.DataFrame:
+    """
+    Memory-lean copy of a loan/student frame: text columns (and the target) as
+    pandas Categorical, numerics downcast per schema. Columns the schema does
+    not know are left alone.
+    """
+    out = df.copy()
+    for col in (*schema.categorical, schema.target_col):
+        if col in out.columns:
+            out[col] = out[col].astype("category")
+    for col, dtype in schema.numeric.items():
+        if col in out.columns:
+            out[col] = _compact_numeric(out[col], dtype)
+    return out
+
+def memory_report(datasets: dict | None = None) -> pd.DataFrame:
+    """
+    Deep memory usage per dataset before and after compact_df.
+    datasets: {name: (df, schema)}; defaults to the loan and student data.
+    """
+    if datasets is None:
+        datasets = {
+            "loan": (load_loan_df(), LOAN_SCHEMA),
+            "student": (load_student_df(), STUDENT_SCHEMA),
+        }
+    rows = []
+    for name, (df, schema) in datasets.items():
+        before = int(df.memory_usage(deep=True).sum())
+        after = int(compact_df(df, schema).memory_usage(deep=True).sum())
+        rows.append(
+            {
+                "dataset": name,
+                "rows": len(df),
+                "bytes_before": before,
+                "bytes_after": after,
+                "ratio": round(before / after, 2) if after else None,
+            }
+        )
+    return pd.DataFrame(rows)
+
+def load_loan_csv(path, chunksize: int = 200_000, use_cache: bool = True) -> pd.DataFrame:
+    return load_csv(path, "loan", chunksize=chunksize, use_cache=use_cache)
+
+def load_student_csv(path, chunksize: int = 200_000, use_cache: bool = True) -> pd.DataFrame:
+    return load_csv(path, "student", chunksize=chunksize, use_cache=use_cache)
+
+def _normalize_chunk(chunk: pd.DataFrame, schema: str) -> pd.DataFrame:
+    chunk = chunk.replace({"": None})
+    if schema == "loan":
+        deps = chunk["Dependents"].str.strip().str.rstrip("+")
+        chunk["Dependents"] = pd.to_numeric(deps, errors="coerce")
+    return chunk
+
+def validate_chunk(chunk: pd.DataFrame, schema: str, offset: int = 0) -> None:
+    """
+    Raise ValueError if a chunk does not match the loan/student schema:
+    missing columns, or target labels outside the known classes.
+    """
+    expected = SCHEMAS[schema]
+    missing = [c for c in expected if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"{schema} data is missing columns: {missing}")
+
+    target, allowed = TARGET_VALUES[schema]
+    labels = chunk[target].dropna()
+    bad = labels[~labels.isin(allowed)]
+    if len(bad):
+        row = offset + int(bad.index[0]) - int(chunk.index[0])
+        raise ValueError(f"{schema} data row {row}: {target}={bad.iloc[0]!r} not in {sorted(allowed)}")
+
+def _source_key(path: Path, schema: str) -> str:
+    # stat plus a hash of the first/last MiB catches edits that keep the mtime
+    st = path.stat()
+    h = hashlib.sha256(f"{CACHE_FORMAT}|{schema}|{st.st_size}|{st.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        h.update(f.read(1 << 20))
+        if st.st_size > (1 << 20):
+            f.seek(max(st.st_size - (1 << 20), 1 << 20))
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+def _cache_prefix(path: Path, schema: str) -> str:
+    return f"{schema}-" + hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:12]
+
+def _arrow_schema(schema: str):
+    types = {"object": pa.string(), "float64": pa.float64()}
+    fields = [pa.field(c, types[t]) for c, t in SCHEMAS[schema].items()]
+    if schema == "loan":
+        fields[list(LOAN_DTYPES).index("Dependents")] = pa.field("Dependents", pa.float64())
+    return pa.schema(fields)
+
+def _iter_chunks(path: Path, schema: str, chunksize: int):
+    offset = 0
+    reader = pd.read_csv(
+        path,
+        dtype=SCHEMAS[schema],
+        usecols=list(SCHEMAS[schema]),
+        chunksize=chunksize,
+        keep_default_na=True,
+    )
+    for chunk in reader:
+        validate_chunk(chunk, schema, offset)
+        offset += len(chunk)
+        count("data.rows_parsed", len(chunk))
+        yield _normalize_chunk(chunk, schema)[list(SCHEMAS[schema])]
+
+@timed("data.load_csv")
+def load_csv(path, schema: str, chunksize: int = 200_000, use_cache: bool = True, memory_map: bool = True) -> pd.DataFrame:
+    """
+    Stream a loan/student CSV in chunks with explicit dtypes, validating each chunk.
+
+    With pyarrow installed, the parsed rows are written batch by batch to an
+    uncompressed Arrow IPC (Feather v2) file under DATA_CACHE_DIR, keyed by the
+    source's size/mtime/content sample. Later loads read that file instead of
+    parsing text. This is a parse cache, not a shared-memory one: to_pandas
+    copies the columns into ordinary pandas blocks, so the returned frame takes
+    as much memory as a parsed one. memory_map only reads the file through the
+    page cache rather than into a separate Arrow buffer first.
+    """
+    if schema not in SCHEMAS:
+        raise ValueError(f"Unknown schema: {schema}")
+    path = Path(path)
+
+    if not use_cache or pa is None:
+        chunks = list(_iter_chunks(path, schema, chunksize))
+        if not chunks:
+            return pd.DataFrame({c: pd.Series(dtype=t) for c, t in SCHEMAS[schema].items()})
+        return pd.concat(chunks, ignore_index=True)
+
+    prefix = _cache_prefix(path, schema)
+    cache_file = DATA_CACHE_DIR / f"{prefix}-{_source_key(path, schema)}.arrow"
+
+    if not cache_file.exists():
+        DATA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(f".tmp{os.getpid()}")
+        arrow_schema = _arrow_schema(schema)
+        try:
+            with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, arrow_schema) as writer:
+                for chunk in _iter_chunks(path, schema, chunksize):
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=arrow_schema, preserve_index=False))
+            os.replace(tmp, cache_file)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        # drop caches of older versions of the same source file
+        for old in DATA_CACHE_DIR.glob(f"{prefix}-*.arrow"):
+            if old != cache_file:
+                old.unlink(missing_ok=True)
 
-def load_student_df() -> pd.DataFrame:
-    df = pd.read_csv(io.StringIO(STUDENT_CSV))
-    df = df.replace({"": None})
-    return df
\ No newline at end of file
+    return feather.read_table(cache_file, memory_map=memory_map).to_pandas()
@@ -0,0 +1,224 @@
+"""
+Input drift monitoring against the training snapshot, in constant memory.
+
+    monitor = get_monitor(train_df, columns=model_bundle["X_cols"])
+    monitor.update(input_row)        # every prediction: a DataFrame or list of records
+    monitor.report()                 # [{feature, kind, n, psi, ks, status}]
+
+Numeric columns are counted in fixed bins cut at training quantiles;
+categorical columns get one counter per training category plus "other".
+Either way a feature is a small count vector (missing values have their own
+bin), so memory does not grow with traffic. Updating with one row is a
+bisect or dict lookup per column (~25us for the loan form); large batches
+are bincounted per column. Live counts are kept in two tumbling windows of `window` rows, so
+scores describe the last window..2*window inputs.
+
+PSI is summed over the bins. KS (numeric only) is the largest gap between
+the binned training and live CDFs, which is exact at the bin edges. Both
+are computed from the counts on demand, in O(bins) per feature.
+"""
+from __future__ import annotations
+
+import bisect
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from lib.data import fingerprint_df
+from lib.models import ModelCache
+
+
+DRIFT_BINS = 20
+DRIFT_WINDOW = int(os.environ.get("XPLAINLAB_DRIFT_WINDOW", "5000"))
+# live rows needed before a status is given
+MIN_ROWS = 30
+# batches smaller than this are counted value by value (no numpy per call)
+SCALAR_ROWS = 32
+# common PSI reading: < 0.1 stable, < 0.25 moderate shift, above that drift
+PSI_LEVELS = (0.1, 0.25)
+
+MONITORS = ModelCache(maxsize=8, name="drift")
+
+
+def _float_one(v) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        try:
+            return float(str(v).strip().rstrip("+"))
+        except ValueError:
+            return math.nan
+
+
+def _as_float(values: np.ndarray) -> np.ndarray:
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        # form/JSON text; "3+" is read as 3 like data.load_csv does for Dependents
+        text = pd.Series(values, dtype=object).astype(str).str.strip().str.rstrip("+")
+        return pd.to_numeric(text, errors="coerce").to_numpy(dtype=np.float64)
+
+
+class _Numeric:
+    kind = "numeric"
+
+    def __init__(self, values: np.ndarray, bins: int):
+        x = _as_float(values)
+        x = x[~np.isnan(x)]
+        # bin 0 is missing, then (-inf, e0], (e0, e1], ..., (e_last, inf)
+        self.edges = np.unique(np.quantile(x, np.linspace(0, 1, bins + 1)[1:-1])) if len(x) else np.empty(0)
+        self._edges = self.edges.tolist()
+        self.size = len(self.edges) + 2
+
+    def index_one(self, v) -> int:
+        x = math.nan if v is None else _float_one(v)
+        return 0 if math.isnan(x) else bisect.bisect_left(self._edges, x) + 1
+
+    def index(self, values: np.ndarray) -> np.ndarray:
+        x = _as_float(values)
+        idx = np.searchsorted(self.edges, x) + 1
+        idx[np.isnan(x)] = 0
+        return idx
+
+
+class _Categorical:
+    kind = "categorical"
+
+    def __init__(self, values: np.ndarray):
+        # bin 0 is missing, then one per training category, then "other"
+        cats = sorted({str(v) for v in values if not pd.isna(v)})
+        self.codes = {c: i + 1 for i, c in enumerate(cats)}
+        self.size = len(cats) + 2
+
+    def index_one(self, v) -> int:
+        if v is None or (isinstance(v, float) and math.isnan(v)):
+            return 0
+        return self.codes.get(str(v).strip(), self.size - 1)
+
+    def index(self, values: np.ndarray) -> np.ndarray:
+        return np.fromiter((self.index_one(v) for v in values), dtype=np.intp, count=len(values))
+
+
+def _psi(expected: np.ndarray, actual: np.ndarray, eps: float = 1e-4) -> float:
+    p = np.clip(expected / max(expected.sum(), 1), eps, None)
+    q = np.clip(actual / max(actual.sum(), 1), eps, None)
+    return float(((q - p) * np.log(q / p)).sum())
+
+
+def _ks(expected: np.ndarray, actual: np.ndarray) -> float | None:
+    # non-missing bins only
+    e, a = expected[1:], actual[1:]
+    if not e.sum() or not a.sum():
+        return None
+    return float(np.abs(np.cumsum(e) / e.sum() - np.cumsum(a) / a.sum()).max())
+
+
+class DriftMonitor:
+    """
+    Streaming per-feature counts of live inputs next to the same counts over
+    the reference (training) rows; see the module docstring.
+    """
+
+    def __init__(self, reference: pd.DataFrame, columns=None, bins: int = DRIFT_BINS, window: int = DRIFT_WINDOW):
+        self.window = window
+        self.features = {}
+        self.reference = {}
+        for col in columns if columns is not None else reference.columns:
+            values = reference[col].to_numpy()
+            if pd.api.types.is_numeric_dtype(reference[col]) and not pd.api.types.is_bool_dtype(reference[col]):
+                feat = _Numeric(values, bins)
+            else:
+                feat = _Categorical(values)
+            self.features[col] = feat
+            self.reference[col] = np.bincount(feat.index(values), minlength=feat.size)
+        self._current = {c: np.zeros(f.size, dtype=np.int64) for c, f in self.features.items()}
+        self._previous = {c: np.zeros(f.size, dtype=np.int64) for c, f in self.features.items()}
+        self._in_window = 0
+        self.n_seen = 0
+        self._lock = threading.Lock()
+
+    def update(self, rows) -> None:
+        """
+        Count a batch of live inputs: a DataFrame or a list of record dicts.
+        Columns the monitor does not know are ignored; absent ones count as missing.
+        """
+        n = len(rows)
+        if not n:
+            return
+        if n < SCALAR_ROWS:
+            if isinstance(rows, pd.DataFrame):
+                # DataFrame.to_dict costs ~1ms even for one row
+                cols = list(rows.columns)
+                records = [dict(zip(cols, r)) for r in rows.to_numpy(dtype=object).tolist()]
+            else:
+                records = rows
+            hits = [(c, f.index_one(r.get(c))) for r in records for c, f in self.features.items()]
+            counts = None
+        elif isinstance(rows, pd.DataFrame):
+            columns = {c: rows[c].to_numpy() if c in rows else np.full(n, None, dtype=object) for c in self.features}
+            counts = {c: np.bincount(f.index(columns[c]), minlength=f.size) for c, f in self.features.items()}
+        else:
+            columns = {c: np.array([r.get(c) for r in rows], dtype=object) for c in self.features}
+            counts = {c: np.bincount(f.index(columns[c]), minlength=f.size) for c, f in self.features.items()}
+        with self._lock:
+            if self._in_window >= self.window:
+                self._previous, self._current = self._current, {c: np.zeros_like(v) for c, v in self._current.items()}
+                self._in_window = 0
+            if counts is None:
+                for c, i in hits:
+                    self._current[c][i] += 1
+            else:
+                for c, v in counts.items():
+                    self._current[c] += v
+            self._in_window += n
+            self.n_seen += n
+
+    def reset(self) -> None:
+        with self._lock:
+            for v in (*self._current.values(), *self._previous.values()):
+                v[:] = 0
+            self._in_window = 0
+            self.n_seen = 0
+
+    def report(self) -> list[dict]:
+        """
+        One row per feature: kind, n (live rows scored), psi, ks (numeric
+        only) and status ("stable" / "moderate" / "drift", or "too few rows"
+        below MIN_ROWS), largest PSI first.
+        """
+        with self._lock:
+            live = {c: self._current[c] + self._previous[c] for c in self.features}
+        rows = []
+        for col, feat in self.features.items():
+            ref, cur = self.reference[col], live[col]
+            n = int(cur.sum())
+            psi = _psi(ref, cur) if n else None
+            if n < MIN_ROWS:
+                status = "too few rows"
+            else:
+                status = "stable" if psi < PSI_LEVELS[0] else "moderate" if psi < PSI_LEVELS[1] else "drift"
+            rows.append(
+                {
+                    "feature": col,
+                    "kind": feat.kind,
+                    "n": n,
+                    "psi": psi,
+                    "ks": _ks(ref, cur) if feat.kind == "numeric" and n else None,
+                    "status": status,
+                }
+            )
+        rows.sort(key=lambda r: -(r["psi"] or 0.0))
+        return rows
+
+
+def get_monitor(reference: pd.DataFrame, columns=None, bins: int = DRIFT_BINS) -> DriftMonitor:
+    """
+    The process-wide DriftMonitor for a reference frame (and column subset),
+    built on first use and shared by every session.
+    """
+    cols = list(columns) if columns is not None else list(reference.columns)
+    key = f"{fingerprint_df(reference)}-{'|'.join(cols)}-{bins}"
+    return MONITORS.get_or_train(key, lambda: DriftMonitor(reference, cols, bins))
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from lib.instrument import stage
+from lib.models import ModelCache, feature_sources
+from lib.registry import load_artifact, save_artifact
+
+
+# permuted rows scored per predict call; repeats are stacked up to this size
+MAX_BLOCK_ROWS = 200_000
+
+IMPORTANCE_CACHE = ModelCache(maxsize=64)
+
+
+def _holdout(model_bundle: dict, df: pd.DataFrame):
+    # the rows train_model held out: labelled rows not in train_index
+    target_col = model_bundle["target_col"]
+    rows = df.dropna(subset=[target_col])
+    rows = rows.loc[~rows.index.isin(model_bundle["train_index"])]
+    return rows[model_bundle["X_cols"]], rows[target_col].astype(str).to_numpy()
+
+
+def _column_blocks(model_bundle: dict) -> list[np.ndarray]:
+    # transformed columns fed by each original column, in X_cols order
+    sources = [src[1] for src in feature_sources(model_bundle)]
+    return [np.flatnonzero([s == c for s in sources]) for c in model_bundle["X_cols"]]
+
+
+def _score_permuted(model, Xt: np.ndarray, y: np.ndarray, cols: np.ndarray, perms: np.ndarray) -> np.ndarray:
+    """
+    Accuracy with `cols` shuffled jointly by each row of `perms`; repeats are
+    stacked so each block is one predict call.
+    """
+    n = len(y)
+    per_block = max(1, MAX_BLOCK_ROWS // max(n, 1))
+    scores = []
+    for start in range(0, len(perms), per_block):
+        block = perms[start : start + per_block]
+        M = np.tile(Xt, (len(block), 1))
+        M[:, cols] = Xt[block.ravel()][:, cols]
+        pred = model.predict(M).astype(str).reshape(len(block), n)
+        scores.append((pred == y).mean(axis=1))
+    return np.concatenate(scores)
+
+
+def permutation_importance(
+    model_bundle: dict,
+    df: pd.DataFrame,
+    n_repeats: int = 10,
+    max_workers: int | None = None,
+    seed: int = 42,
+) -> dict:
+    """
+    Permutation feature importance on the holdout split of train_model.
+
+    Each original column (all of its one-hot outputs together) is shuffled
+    n_repeats times; importance is the drop in holdout accuracy. The holdout
+    is transformed once and shuffled in transformed space, which is the same
+    as shuffling the raw column because preprocessing is row-wise. Columns are
+    scored in parallel threads.
+
+    Returns dict with baseline (holdout accuracy), n_rows, n_repeats and
+    importances: [{feature, mean, std}] sorted by mean, largest first.
+    """
+    model = model_bundle["pipeline"].named_steps["model"]
+    X, y = _holdout(model_bundle, df)
+    if not len(y):
+        raise ValueError("No holdout rows to compute permutation importance on.")
+
+    with stage("importance.permutation"):
+        Xt = model_bundle["pipeline"].named_steps["pre"].transform(X)
+        Xt = Xt.toarray() if sp.issparse(Xt) else np.asarray(Xt, dtype=np.float64)
+        baseline = float((model.predict(Xt).astype(str) == y).mean())
+
+        blocks = _column_blocks(model_bundle)
+        rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(blocks))]
+
+        def _one(j: int) -> np.ndarray:
+            perms = np.stack([rngs[j].permutation(len(y)) for _ in range(n_repeats)])
+            return baseline - _score_permuted(model, Xt, y, blocks[j], perms)
+
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            drops = list(pool.map(_one, range(len(blocks))))
+
+    importances = [
+        {"feature": col, "mean": float(d.mean()), "std": float(d.std())}
+        for col, d in zip(model_bundle["X_cols"], drops)
+    ]
+    importances.sort(key=lambda r: -r["mean"])
+    return {"baseline": baseline, "n_rows": int(len(y)), "n_repeats": n_repeats, "importances": importances}
+
+
+def get_importance(
+    model_bundle: dict,
+    df: pd.DataFrame,
+    n_repeats: int = 10,
+    seed: int = 42,
+    root: Path | None = None,
+    persist: bool = True,
+) -> dict:
+    """
+    permutation_importance, computed once per model version: kept in a
+    process-wide cache and, with persist=True, saved next to the bundle in
+    the model registry so restarts reuse it.
+    """
+    version = model_bundle.get("version") or str(id(model_bundle["pipeline"]))
+    suffix = hashlib.sha256(json.dumps([n_repeats, seed]).encode()).hexdigest()[:8]
+    name = f"importance-{suffix}"
+
+    def _compute() -> dict:
+        if persist:
+            saved = load_artifact(version, name, root)
+            if saved is not None:
+                return saved
+        result = permutation_importance(model_bundle, df, n_repeats=n_repeats, seed=seed)
+        if persist:
+            try:
+                save_artifact(version, name, result, root)
+            except OSError:
+                pass
+        return result
+
+    return IMPORTANCE_CACHE.get_or_train(f"{version}-{name}", _compute)
+
+
+def importance_frame(result: dict) -> pd.DataFrame:
+    return pd.DataFrame(result["importances"]).rename(columns={"mean": "importance"})
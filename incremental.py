@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from sklearn.linear_model import SGDClassifier
+from sklearn.neighbors import KNeighborsClassifier
+
+from lib.compact import CompactKNeighborsClassifier
+from lib.models import fingerprint_df, train_model
+
+
+# rows kept per bundle to re-estimate numeric medians after updates
+RESERVOIR_SIZE = 10_000
+
+
+def _steps(model_bundle: dict):
+    pre = model_bundle["pipeline"].named_steps["pre"]
+    num = pre.named_transformers_.get("num")
+    cat = pre.named_transformers_.get("cat")
+    num_cols = next((list(c) for n, _, c in pre.transformers_ if n == "num"), [])
+    cat_cols = next((list(c) for n, _, c in pre.transformers_ if n == "cat"), [])
+    return pre, num if num_cols else None, cat if cat_cols else None, num_cols, cat_cols
+
+
+def _next_label(df: pd.DataFrame) -> int:
+    # first index label past the training frame's, for rows update_model appends
+    if len(df) and pd.api.types.is_integer_dtype(df.index):
+        return max(int(df.index.max()) + 1, len(df))
+    return len(df)
+
+
+def _init_state(model_bundle: dict, X_train: pd.DataFrame, next_label: int, seed: int = 42) -> dict:
+    _, _, _, num_cols, cat_cols = _steps(model_bundle)
+    rng = np.random.default_rng(seed)
+    num = X_train[num_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    if len(num) > RESERVOIR_SIZE:
+        num = num[rng.choice(len(num), RESERVOIR_SIZE, replace=False)]
+    return {
+        "n_seen": int(len(X_train)),
+        "reservoir": num,
+        "cat_counts": {c: X_train[c].dropna().astype(str).value_counts().to_dict() for c in cat_cols},
+        "rng": rng,
+        "n_updates": 0,
+        "next_label": next_label,
+    }
+
+
+def train_incremental_model(df: pd.DataFrame, target_col: str, algo: str, params: dict | None = None) -> dict:
+    """
+    train_model(incremental=True) plus the running statistics update_model needs.
+    Decision Trees cannot be extended in place and are rejected.
+    """
+    if algo == "Decision Tree":
+        raise ValueError("Decision Tree does not support incremental updates; retrain with train_model.")
+    bundle = train_model(df, target_col, algo, params, incremental=True)
+    X_train = df.loc[bundle["train_index"], bundle["X_cols"]]
+    bundle["online_state"] = _init_state(bundle, X_train, _next_label(df))
+    return bundle
+
+
+def _reservoir_update(state: dict, rows: np.ndarray) -> None:
+    # Algorithm R, with all random draws for the batch made at once
+    res = state["reservoir"]
+    n_seen = state["n_seen"]
+    room = max(0, RESERVOIR_SIZE - len(res))
+    head, rows = rows[:room], rows[room:]
+    if len(head):
+        res = np.vstack([res, head])
+        n_seen += len(head)
+    if len(rows):
+        # the i-th remaining row is item n_seen + i + 1 of the stream
+        slots = state["rng"].integers(0, n_seen + np.arange(1, len(rows) + 1))
+        keep = slots < RESERVOIR_SIZE
+        res[slots[keep]] = rows[keep]
+    state["reservoir"] = res
+
+
+def _restandardize(M: np.ndarray, n_num: int, old_mean, old_scale, new_mean, new_scale) -> None:
+    # in place; the numeric block occupies the first n_num columns of the ColumnTransformer output
+    M[:, :n_num] = (M[:, :n_num] * old_scale + old_mean - new_mean) / new_scale
+
+
+def _fit_blocks(model: KNeighborsClassifier):
+    # compact KNN dequantizes block by block; sklearn's keeps the matrix itself
+    if isinstance(model, CompactKNeighborsClassifier):
+        yield from model.blocks()
+    else:
+        yield 0, model._fit_X
+
+
+def _copy_for_update(model_bundle: dict) -> dict:
+    # fresh copies of what update_model mutates (preprocessor, online state,
+    # SGD weights); everything else, KNN's training matrix included, is shared
+    bundle = dict(model_bundle)
+    pipe = copy.copy(model_bundle["pipeline"])
+    pre = pipe.named_steps["pre"]
+    model = pipe.named_steps["model"]
+    # KNN is refitted, which rebinds its arrays instead of writing into them
+    model = copy.copy(model) if isinstance(model, KNeighborsClassifier) else copy.deepcopy(model)
+    pipe.steps = [("pre", copy.deepcopy(pre)), ("model", model)]
+    bundle["pipeline"] = pipe
+    bundle["online_state"] = copy.deepcopy(model_bundle["online_state"])
+    return bundle
+
+
+def update_model(model_bundle: dict, new_rows: pd.DataFrame) -> dict:
+    """
+    Absorb newly labelled rows without refitting from scratch.
+
+      - numeric imputer medians are re-estimated from a bounded reservoir sample
+      - scaler mean/variance are updated with StandardScaler.partial_fit
+      - categorical imputer modes come from running counts
+      - SGD (incremental Logistic Regression) gets a partial_fit step; its
+        weights are first re-expressed for the new scaling, so old knowledge
+        is kept exactly
+      - KNN is refitted on its old rows, re-expressed for the new scaling,
+        plus the new ones: unlike SGD, a KNN update costs O(rows seen so far)
+
+    The new rows are kept in bundle["added_rows"] under fresh index labels
+    past the original frame's, and appended to train_index; use
+    models.training_rows to get every row the bundle was fitted on.
+
+    One-hot categories stay as fitted; unseen categories encode as all zeros.
+    Returns a new bundle; the input bundle is left untouched (it may be shared).
+    """
+    if "online_state" not in model_bundle:
+        raise ValueError("Bundle was not trained with train_incremental_model.")
+    target_col = model_bundle["target_col"]
+    new_rows = new_rows.dropna(subset=[target_col])
+    if not len(new_rows):
+        return model_bundle
+
+    bundle = _copy_for_update(model_bundle)
+    state = bundle["online_state"]
+    pre, num, cat, num_cols, cat_cols = _steps(bundle)
+    model = bundle["pipeline"].named_steps["model"]
+
+    X = new_rows[bundle["X_cols"]]
+    y = new_rows[target_col].astype(str).to_numpy()
+    unknown = set(y) - set(model.classes_)
+    if unknown:
+        raise ValueError(f"Unknown labels for incremental update: {sorted(unknown)}")
+
+    # --- categorical modes
+    if cat is not None:
+        imputer = cat.named_steps["imputer"]
+        stats = imputer.statistics_.copy()
+        for j, col in enumerate(cat_cols):
+            counts = state["cat_counts"][col]
+            for value, n in X[col].dropna().astype(str).value_counts().items():
+                counts[value] = counts.get(value, 0) + int(n)
+            stats[j] = max(counts, key=counts.get)
+        imputer.statistics_ = stats
+
+    # --- numeric medians + running mean/variance
+    old_mean = old_scale = None
+    if num is not None:
+        raw = X[num_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        _reservoir_update(state, raw)
+
+        imputer = num.named_steps["imputer"]
+        medians = np.nanmedian(state["reservoir"], axis=0)
+        imputer.statistics_ = np.where(np.isnan(medians), imputer.statistics_, medians)
+
+        scaler = num.named_steps["scaler"]
+        old_mean, old_scale = scaler.mean_.copy(), scaler.scale_.copy()
+        scaler.partial_fit(imputer.transform(pd.DataFrame(raw, columns=num_cols)))
+    state["n_seen"] += len(X)
+    state["n_updates"] += 1
+
+    Xt_new = pre.transform(X)
+    n_num = len(num_cols)
+
+    if isinstance(model, SGDClassifier):
+        if old_mean is not None:
+            # w.x_old + b == w'.x_new + b' for every raw x
+            ratio = scaler.scale_ / old_scale
+            shift = (scaler.mean_ - old_mean) / old_scale
+            model.intercept_ = model.intercept_ + model.coef_[:, :n_num] @ shift
+            model.coef_[:, :n_num] = model.coef_[:, :n_num] * ratio
+        model.partial_fit(Xt_new, y)
+    elif isinstance(model, KNeighborsClassifier):
+        n_fit = model.n_samples_fit_
+        all_X = np.empty((n_fit + Xt_new.shape[0], Xt_new.shape[1]))
+        # old rows are copied into the refit matrix once, re-expressed for the new scaling
+        for start, block in _fit_blocks(model):
+            rows = all_X[start : start + block.shape[0]]
+            rows[:] = block.toarray() if sp.issparse(block) else block
+            if old_mean is not None:
+                _restandardize(rows, n_num, old_mean, old_scale, scaler.mean_, scaler.scale_)
+        all_X[n_fit:] = Xt_new.toarray() if sp.issparse(Xt_new) else Xt_new
+        all_y = np.concatenate([model.classes_[model._y], y])
+        model.fit(all_X, all_y)
+    else:
+        raise ValueError(f"Incremental updates are not supported for {type(model).__name__}.")
+
+    # the caller's labels may collide with the training frame's (e.g. both 0..n)
+    start = state["next_label"]
+    added = new_rows.set_axis(pd.RangeIndex(start, start + len(new_rows)))
+    state["next_label"] = start + len(new_rows)
+    previous = bundle.get("added_rows")
+    bundle["added_rows"] = added if previous is None else pd.concat([previous, added])
+    bundle["train_index"] = np.concatenate([np.asarray(bundle["train_index"]), added.index.to_numpy()])
+    bundle["metrics"] = {
+        **bundle["metrics"],
+        "n_rows": bundle["metrics"]["n_rows"] + len(new_rows),
+        "n_updates": state["n_updates"],
+    }
+    bundle["version"] = hashlib.sha256(f"{model_bundle['version']}|{fingerprint_df(new_rows)}".encode()).hexdigest()[:16]
+    return bundle
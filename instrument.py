@@ -0,0 +1,212 @@
+"""
+Stage timers and counters for the hot paths (data loading, training,
+preprocessing, predict, explanations, plotting).
+
+    from lib.instrument import count, stage, timed
+
+    with stage("models.predict"):
+        ...
+
+    @timed("data.load_csv")
+    def load_csv(...): ...
+
+Samples go to a per-process REGISTRY, exportable as Prometheus text
+(to_prometheus) or JSON lines (to_json_lines). Recording is off unless
+XPLAINLAB_TIMING=1 is set or enable() is called; inside a trace() block the
+stages of that block are also collected for a per-request breakdown. With
+neither active a timer is a flag check and a shared no-op context manager.
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+# histogram bucket upper bounds, seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+_enabled = os.environ.get("XPLAINLAB_TIMING", "").lower() in ("1", "true", "yes")
+_trace: contextvars.ContextVar[list | None] = contextvars.ContextVar("xplainlab_trace", default=None)
+_NOOP = nullcontext()
+
+
+class Registry:
+    """
+    Thread-safe totals per stage (count, sum, max, histogram) and per counter.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: dict[str, list] = {}
+        self._counters: dict[str, float] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            s = self._stages.get(name)
+            if s is None:
+                s = self._stages[name] = [0, 0.0, 0.0, [0] * len(BUCKETS)]
+            s[0] += 1
+            s[1] += seconds
+            s[2] = max(s[2], seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    s[3][i] += 1
+                    break
+
+    def inc(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {
+                    name: {"count": c, "sum": total, "max": mx, "buckets": list(b)}
+                    for name, (c, total, mx, b) in self._stages.items()
+                },
+                "counters": dict(self._counters),
+            }
+
+    def to_prometheus(self, prefix: str = "xplainlab") -> str:
+        snap = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Wall time per instrumented stage.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for name, s in sorted(snap["stages"].items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, s["buckets"]):
+                cumulative += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {s["count"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {s["sum"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        if snap["counters"]:
+            lines.append(f"# HELP {prefix}_events_total Instrumented event counters.")
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            for name, v in sorted(snap["counters"].items()):
+                lines.append(f'{prefix}_events_total{{name="{name}"}} {v:g}')
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self) -> str:
+        snap = self.snapshot()
+        ts = time.time()
+        rows = [
+            {"ts": ts, "type": "stage", "name": name, **{k: v for k, v in s.items() if k != "buckets"}}
+            for name, s in sorted(snap["stages"].items())
+        ]
+        rows += [{"ts": ts, "type": "counter", "name": name, "value": v} for name, v in sorted(snap["counters"].items())]
+        return "".join(json.dumps(r) + "\n" for r in rows)
+
+
+REGISTRY = Registry()
+
+
+def enable(on: bool = True) -> None:
+    global _enabled
+    _enabled = on
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+@contextmanager
+def _timer(name: str, spans: list | None):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        if _enabled:
+            REGISTRY.observe(name, dt)
+        if spans is not None:
+            spans.append((name, dt))
+
+
+def stage(name: str):
+    """
+    Context manager timing one stage; a no-op unless recording or tracing.
+    """
+    spans = _trace.get()
+    if not _enabled and spans is None:
+        return _NOOP
+    return _timer(name, spans)
+
+
+def timed(name: str):
+    """
+    Decorator form of stage().
+    """
+
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled and _trace.get() is None:
+                return fn(*args, **kwargs)
+            with _timer(name, _trace.get()):
+                return fn(*args, **kwargs)
+
+        return inner
+
+    return wrap
+
+
+def count(name: str, n: float = 1) -> None:
+    if _enabled:
+        REGISTRY.inc(name, n)
+
+
+def start_trace() -> list:
+    """
+    Begin collecting stages for the rest of the current context and return
+    the span list. For script-style callers (Streamlit pages) that cannot
+    wrap their body in trace().
+    """
+    spans: list = []
+    _trace.set(spans)
+    return spans
+
+
+def stop_trace() -> None:
+    _trace.set(None)
+
+
+@contextmanager
+def trace():
+    """
+    Collect the stages run inside this block (in this thread/context) as a
+    list of (stage, seconds), in completion order. Nested stages are listed
+    individually, so times of a parent include its children.
+    """
+    spans: list = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+def breakdown(spans: list) -> list[dict]:
+    """
+    Per-stage totals of a trace, slowest first.
+    """
+    totals: dict[str, list] = {}
+    for name, dt in spans:
+        t = totals.setdefault(name, [0, 0.0])
+        t[0] += 1
+        t[1] += dt
+    return [
+        {"stage": name, "calls": c, "ms": round(s * 1000.0, 3)}
+        for name, (c, s) in sorted(totals.items(), key=lambda kv: -kv[1][1])
+    ]
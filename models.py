@@ -1,25 +1,54 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable
+
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+
+from lib.data import DatasetSchema, fingerprint_df, schema_for_columns
+from lib.instrument import count, stage, timed
 
-from sklearn.compose import ColumnTransformer
-from sklearn.impute import SimpleImputer
-from sklearn.metrics import accuracy_score
-from sklearn.model_selection import train_test_split
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.tree import DecisionTreeClassifier, export_text
+if TYPE_CHECKING:
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
 
-from sklearn.linear_model import LogisticRegression
+# sklearn is imported where it is used (and each estimator only for its own
+# algorithm): importing it costs more than a page render, and pages that only
+# need ALGORITHMS or a redirect should not pay for it
 
 
 ALGORITHMS = ["Decision Tree", "KNN", "Logistic Regression"]
 
+# how compact.compact_estimator stores the KNN training matrix after fitting;
+# float32 by default, float64 keeps sklearn's own estimator
+KNN_STORAGES = ("float64", "float32", "int8")
+KNN_STORAGE = os.environ.get("XPLAINLAB_KNN_STORAGE", "float32")
+
+
+def build_preprocessor(X: pd.DataFrame, schema: DatasetSchema | None = None) -> ColumnTransformer:
+    """
+    Unfitted ColumnTransformer: median-imputed, scaled numerics and
+    mode-imputed, one-hot categoricals.
+    """
+    from sklearn.compose import ColumnTransformer
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
 
-def _build_preprocessor(X: pd.DataFrame) -> ColumnTransformer:
-    cat_cols = [c for c in X.columns if X[c].dtype == "object"]
+    # known datasets route by schema; anything else by dtype (text/category -> one-hot)
+    schema = schema or schema_for_columns(X.columns)
+    if schema is not None:
+        cat_cols = [c for c in X.columns if c in schema.categorical]
+    else:
+        cat_cols = [c for c in X.columns if not pd.api.types.is_numeric_dtype(X[c])]
     num_cols = [c for c in X.columns if c not in cat_cols]
 
     numeric = Pipeline(
@@ -44,43 +73,152 @@ def _build_preprocessor(X: pd.DataFrame) -> ColumnTransformer:
     )
 
 
-def _build_model(algo: str):
+def build_model(algo: str, params: dict | None = None, incremental: bool = False):
+    """
+    Unfitted estimator for an algorithm name; incremental=True picks one
+    that incremental.update_model can extend.
+    """
+    params = params or {}
+    if algo == "Logistic Regression" and incremental:
+        from sklearn.linear_model import SGDClassifier
+
+        # same log-loss objective, but updatable with partial_fit
+        return SGDClassifier(**{"loss": "log_loss", "alpha": 1e-4, "max_iter": 2000, "random_state": 42, **params})
     if algo == "Decision Tree":
-        return DecisionTreeClassifier(max_depth=4, random_state=42)
+        from sklearn.tree import DecisionTreeClassifier
+
+        return DecisionTreeClassifier(**{"max_depth": 4, "random_state": 42, **params})
     if algo == "KNN":
-        return KNeighborsClassifier(n_neighbors=5)
+        from sklearn.neighbors import KNeighborsClassifier
+
+        return KNeighborsClassifier(**{"n_neighbors": 5, **params})
     if algo == "Logistic Regression":
-        return LogisticRegression(max_iter=2000)
+        from sklearn.linear_model import LogisticRegression
+
+        return LogisticRegression(**{"max_iter": 2000, **params})
     raise ValueError(f"Unknown algorithm: {algo}")
 
 
-def train_model(df: pd.DataFrame, target_col: str, algo: str) -> dict:
+def model_version(
+    df: pd.DataFrame,
+    target_col: str,
+    algo: str,
+    params: dict | None = None,
+    incremental: bool = False,
+    knn_storage: str | None = None,
+) -> str:
+    """
+    Stable id of a trained model: training data + target + algorithm + hyperparameters
+    (+ KNN storage when it is not the float32 default).
     """
+    payload = {
+        "data": fingerprint_df(df),
+        "target": target_col,
+        "algo": algo,
+        "params": params or {},
+    }
+    if incremental:
+        payload["incremental"] = True
+    if algo == "KNN" and (knn_storage or KNN_STORAGE) != "float32":
+        payload["knn_storage"] = knn_storage or KNN_STORAGE
+    raw = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+@timed("models.train_model")
+def train_model(
+    df: pd.DataFrame,
+    target_col: str,
+    algo: str,
+    params: dict | None = None,
+    incremental: bool = False,
+    knn_storage: str | None = None,
+) -> dict:
+    """
+    incremental=True fits estimators that incremental.update_model can extend
+    (SGD log-loss instead of LogisticRegression).
+
+    The fitted estimator is compacted (compact.compact_estimator) before the
+    holdout is scored; knn_storage picks float64/float32/int8 for KNN
+    (default KNN_STORAGE). With int8 the holdout accuracy lost to quantization
+    is reported as metrics["accuracy_delta"].
+
     Returns dict with:
       - pipeline
       - feature_names (after preprocessing)
       - X_cols (original)
-      - metrics
+      - metrics (incl. bundle_bytes, the bytes of its arrays)
+      - version (see model_version)
+      - train_index (df index labels of the training rows, in fit order;
+        see training_rows)
     """
+    from sklearn.metrics import accuracy_score
+    from sklearn.pipeline import Pipeline
+
+    from lib.compact import PROBE_ROWS, bundle_nbytes
+
+    version = model_version(df, target_col, algo, params, incremental, knn_storage)
+    df, X, X_train, X_test, y_train, y_test = _split(df, target_col)
+
+    pre = build_preprocessor(X)
+    model = build_model(algo, params, incremental)
+
+    pipe = Pipeline(steps=[("pre", pre), ("model", model)])
+    pipe.fit(X_train, y_train)
+
+    def _holdout_accuracy():
+        return float(accuracy_score(y_test, pipe.predict(X_test))) if len(y_test) else None
+
+    probe = pre.transform((X_test if len(X_test) else X_train).iloc[:PROBE_ROWS])
+    model, extra = _compact(model, algo, knn_storage, _holdout_accuracy, probe)
+    pipe.steps[-1] = ("model", model)
+    acc = _holdout_accuracy()
+
+    bundle = _make_bundle(pipe, df, X, X_train, acc, version, algo, target_col, params)
+    bundle["incremental"] = incremental
+    bundle["metrics"].update(_with_delta(extra, acc))
+    bundle["metrics"]["bundle_bytes"] = bundle_nbytes(bundle)
+    return bundle
+
+
+def _compact(model, algo: str, knn_storage: str | None, holdout_accuracy: Callable[[], float | None], probe) -> tuple:
+    # compacted estimator + metrics to record; int8 KNN also scores the
+    # uncompacted model on the holdout so the quantization loss is measured.
+    # probe: transformed rows for compact_estimator's parity check
+    from lib.compact import compact_estimator
+
+    extra = {}
+    if algo == "KNN":
+        extra["knn_storage"] = knn_storage or KNN_STORAGE
+        if extra["knn_storage"] == "int8":
+            extra["accuracy_full"] = holdout_accuracy()
+    return compact_estimator(model, knn_storage, probe), extra
+
+
+def _with_delta(extra: dict, acc: float | None) -> dict:
+    extra = dict(extra)
+    if "accuracy_full" in extra:
+        full = extra.pop("accuracy_full")
+        extra["accuracy_delta"] = None if acc is None or full is None else acc - full
+    return extra
+
+
+def _split(df: pd.DataFrame, target_col: str):
+    from sklearn.model_selection import train_test_split
+
     df = df.copy()
     df = df.dropna(subset=[target_col])
 
     X = df.drop(columns=[target_col])
     y = df[target_col].astype(str)
 
-    pre = _build_preprocessor(X)
-    model = _build_model(algo)
-
-    pipe = Pipeline(steps=[("pre", pre), ("model", model)])
-
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.25, random_state=42, stratify=y if y.nunique() > 1 else None
     )
-    pipe.fit(X_train, y_train)
+    return df, X, X_train, X_test, y_train, y_test
 
-    y_pred = pipe.predict(X_test)
-    acc = float(accuracy_score(y_test, y_pred)) if len(y_test) else None
 
+def _make_bundle(pipe, df, X, X_train, acc, version, algo, target_col, params) -> dict:
     # feature names after preprocessing (for explanations)
     feature_names = None
     try:
@@ -93,22 +231,431 @@ def train_model(df: pd.DataFrame, target_col: str, algo: str) -> dict:
         "pipeline": pipe,
         "feature_names": feature_names,
         "X_cols": list(X.columns),
+        "train_index": X_train.index.to_numpy(),
         "metrics": {"accuracy_holdout": acc, "n_rows": int(len(df))},
+        "version": version,
+        "algo": algo,
+        "target_col": target_col,
+        "params": dict(params or {}),
+        "incremental": False,
+    }
+
+
+def training_rows(model_bundle: dict, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The rows a bundle was fitted on, in fit order: df.loc[train_index] plus
+    the rows update_model appended, which live in the bundle rather than df.
+    """
+    train_index = np.asarray(model_bundle["train_index"])
+    added = model_bundle.get("added_rows")
+    if added is None or not len(added):
+        return df.loc[train_index]
+    return pd.concat([df.loc[train_index[: len(train_index) - len(added)]], added])
+
+
+def train_all_models(
+    df: pd.DataFrame,
+    target_col: str,
+    algos: list[str] | None = None,
+    params: dict | None = None,
+    max_workers: int | None = None,
+    knn_storage: str | None = None,
+) -> dict:
+    """
+    Fit several algorithms on the same split, sharing one fitted preprocessor.
+    Estimators are fitted concurrently in a thread pool (sklearn's fit loops
+    release the GIL). params: optional {algo: hyperparameters}.
+
+    Returns dict with:
+      - bundles: {algo: bundle}, each identical to train_model(df, target_col, algo)
+      - metrics: {algo: metrics}
+      - version
+    """
+    from lib.compact import PROBE_ROWS, bundle_nbytes
+    from sklearn.metrics import accuracy_score
+    from sklearn.pipeline import Pipeline
+
+    algos = list(algos or ALGORITHMS)
+    params = params or {}
+    df, X, X_train, X_test, y_train, y_test = _split(df, target_col)
+
+    pre = build_preprocessor(X).fit(X_train, y_train)
+    Xt_train = pre.transform(X_train)
+    Xt_test = pre.transform(X_test)
+
+    def _fit(algo: str):
+        model = build_model(algo, params.get(algo)).fit(Xt_train, y_train)
+
+        def _holdout_accuracy():
+            return float(accuracy_score(y_test, model.predict(Xt_test))) if len(y_test) else None
+
+        probe = (Xt_test if Xt_test.shape[0] else Xt_train)[:PROBE_ROWS]
+        model, extra = _compact(model, algo, knn_storage, _holdout_accuracy, probe)
+        acc = _holdout_accuracy()
+        return algo, model, acc, _with_delta(extra, acc)
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(algos)) as pool:
+        fitted = list(pool.map(_fit, algos))
+
+    bundles = {}
+    for algo, model, acc, extra in fitted:
+        pipe = Pipeline(steps=[("pre", pre), ("model", model)])
+        version = model_version(df, target_col, algo, params.get(algo), knn_storage=knn_storage)
+        bundles[algo] = _make_bundle(pipe, df, X, X_train, acc, version, algo, target_col, params.get(algo))
+        bundles[algo]["metrics"].update(extra)
+        bundles[algo]["metrics"]["bundle_bytes"] = bundle_nbytes(bundles[algo])
+
+    return {
+        "bundles": bundles,
+        "metrics": {algo: b["metrics"] for algo, b in bundles.items()},
+        "version": model_version(df, target_col, "|".join(algos), params),
     }
 
 
-def predict_with_explanations(model_bundle: dict, input_row: pd.DataFrame, algo: str) -> dict:
+def compare_predictions(combined: dict, input_row: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per algorithm: prediction, class probabilities and holdout accuracy
+    for a single input. The shared preprocessor runs once.
+    """
+    bundles = combined["bundles"]
+    first = next(iter(bundles.values()))
+    Xt = first["pipeline"].named_steps["pre"].transform(input_row[first["X_cols"]])
+
+    rows = []
+    for algo, bundle in bundles.items():
+        model = bundle["pipeline"].named_steps["model"]
+        row = {"algorithm": algo, "prediction": model.predict(Xt)[0]}
+        if hasattr(model, "predict_proba"):
+            for cls, p in zip(model.classes_, model.predict_proba(Xt)[0]):
+                row[f"P({cls})"] = float(p)
+        row["holdout_accuracy"] = bundle["metrics"]["accuracy_holdout"]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+class ModelCache:
+    """
+    Process-wide LRU cache of trained bundles (or any other shared results).
+
+    Concurrent misses on the same key are single-flighted: the first caller
+    trains, the others wait on a per-key lock and then read the result.
+    With ttl (seconds) entries older than that count as misses. Hits and
+    misses are also counted in lib.instrument as "<name>.cache_hit/_miss".
+    """
+
+    def __init__(self, maxsize: int = 32, ttl: float | None = None, name: str = "models"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._items: OrderedDict[str, dict] = OrderedDict()
+        self._born: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._inflight: dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _live(self, key: str) -> bool:
+        # caller holds self._lock; drops the entry if it has expired
+        if key not in self._items:
+            return False
+        if self.ttl is not None and time.monotonic() - self._born[key] > self.ttl:
+            del self._items[key], self._born[key]
+            self.expirations += 1
+            return False
+        self._items.move_to_end(key)
+        return True
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            return self._items[key] if self._live(key) else None
+
+    def put(self, key: str, bundle: dict) -> None:
+        with self._lock:
+            self._items[key] = bundle
+            self._born[key] = time.monotonic()
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                old, _ = self._items.popitem(last=False)
+                del self._born[old]
+                self.evictions += 1
+
+    def get_or_train(self, key: str, train_fn: Callable[[], dict]) -> dict:
+        with self._lock:
+            if self._live(key):
+                self.hits += 1
+                count(f"{self.name}.cache_hit")
+                return self._items[key]
+            flight = self._inflight.setdefault(key, threading.Lock())
+
+        with flight:
+            with self._lock:
+                # another session may have finished the fit while we waited
+                if self._live(key):
+                    self.hits += 1
+                    count(f"{self.name}.cache_hit")
+                    return self._items[key]
+                self.misses += 1
+            count(f"{self.name}.cache_miss")
+            try:
+                bundle = train_fn()
+                self.put(key, bundle)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        return bundle
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._born.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+MODEL_CACHE = ModelCache(maxsize=32)
+
+# predict_with_explanations results, keyed by model version + canonical input
+RESULT_CACHE = ModelCache(
+    maxsize=int(os.environ.get("XPLAINLAB_RESULT_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("XPLAINLAB_RESULT_CACHE_TTL", "3600")),
+    name="results",
+)
+
+# numeric inputs are rounded to this many significant digits for the result cache
+INPUT_DIGITS = 8
+
+
+def get_model(
+    df: pd.DataFrame,
+    target_col: str,
+    algo: str,
+    params: dict | None = None,
+    cache: ModelCache | None = None,
+    trainer: Callable[..., dict] | None = None,
+) -> dict:
+    """
+    Cached train_model: returns the shared bundle for (data, target, algo, params).
+    Bundles are shared between sessions, so callers must not mutate them.
+    `trainer` replaces train_model on a miss (e.g. registry.train_or_load).
+    """
+    cache = cache or MODEL_CACHE
+    trainer = trainer or train_model
+    key = model_version(df, target_col, algo, params)
+    return cache.get_or_train(key, lambda: trainer(df, target_col, algo, params))
+
+
+def get_all_models(df: pd.DataFrame, target_col: str, cache: ModelCache | None = None) -> dict:
+    """
+    Cached train_all_models over ALGORITHMS. The per-algorithm bundles are
+    also put in the cache, so get_model hits for them afterwards.
+    """
+    cache = cache or MODEL_CACHE
+    key = "all-" + model_version(df, target_col, "|".join(ALGORITHMS))
+
+    def _train() -> dict:
+        combined = train_all_models(df, target_col)
+        for bundle in combined["bundles"].values():
+            if cache.get(bundle["version"]) is None:
+                cache.put(bundle["version"], bundle)
+        return combined
+
+    return cache.get_or_train(key, _train)
+
+
+_RULES_TEXT: OrderedDict[str, str] = OrderedDict()
+_RULES_TEXT_LOCK = threading.Lock()
+
+
+def tree_rules_text(model_bundle: dict) -> str:
+    """
+    export_text of the whole tree, rendered once per model version.
+    """
+    key = model_bundle.get("version") or str(id(model_bundle["pipeline"]))
+    with _RULES_TEXT_LOCK:
+        if key in _RULES_TEXT:
+            _RULES_TEXT.move_to_end(key)
+            return _RULES_TEXT[key]
+
+    from sklearn.tree import export_text
+
+    tree = model_bundle["pipeline"].named_steps["model"]
+    try:
+        text = export_text(tree, feature_names=model_bundle["feature_names"], decimals=2)
+    except Exception:
+        text = "Rule extraction unavailable."
+
+    with _RULES_TEXT_LOCK:
+        _RULES_TEXT[key] = text
+        while len(_RULES_TEXT) > MODEL_CACHE.maxsize:
+            _RULES_TEXT.popitem(last=False)
+    return text
+
+
+def clear_caches() -> None:
+    """
+    Empty the process-wide model, prediction-result and tree-rules caches.
+    """
+    MODEL_CACHE.clear()
+    RESULT_CACHE.clear()
+    with _RULES_TEXT_LOCK:
+        _RULES_TEXT.clear()
+
+
+def feature_sources(model_bundle: dict) -> list[tuple]:
+    """
+    For every transformed feature: ("num", column, mean, scale) or ("cat", column, category).
+    """
+    pre = model_bundle["pipeline"].named_steps["pre"]
+    sources = []
+    for name, trans, cols in pre.transformers_:
+        if name == "num" and len(cols):
+            scaler = trans.named_steps["scaler"]
+            for col, mean, scale in zip(cols, scaler.mean_, scaler.scale_):
+                sources.append(("num", col, float(mean), float(scale)))
+        elif name == "cat" and len(cols):
+            for col, cats in zip(cols, trans.named_steps["onehot"].categories_):
+                sources.extend(("cat", col, cat) for cat in cats)
+    return sources
+
+
+def _decision_paths(model_bundle: dict, Xt, X: pd.DataFrame) -> list[dict]:
+    tree = model_bundle["pipeline"].named_steps["model"]
+    t = tree.tree_
+    sources = feature_sources(model_bundle)
+    indicator = tree.decision_path(Xt)
+    leaves = tree.apply(Xt)
+    columns = {c: X[c].to_numpy() for c in X.columns}
+
+    paths = []
+    for r in range(indicator.shape[0]):
+        nodes = indicator.indices[indicator.indptr[r]:indicator.indptr[r + 1]]
+        conditions = []
+        # every node but the leaf is a split; the next node tells which side we took
+        for node, child in zip(nodes[:-1], nodes[1:]):
+            src = sources[t.feature[node]]
+            went_left = child == t.children_left[node]
+            col = src[1]
+            value = columns[col][r]
+            if src[0] == "num":
+                threshold = t.threshold[node] * src[3] + src[2]
+                op = "<=" if went_left else ">"
+                rule = f"{col} {op} {threshold:.2f}"
+            else:
+                # one-hot split at 0.5: left means "not this category"
+                threshold = src[2]
+                op = "!=" if went_left else "=="
+                rule = f"{col} {op} {threshold}"
+            conditions.append(
+                {
+                    "node": int(node),
+                    "feature": col,
+                    "op": op,
+                    "threshold": threshold if src[0] == "cat" else float(threshold),
+                    "value": None if pd.isna(value) else getattr(value, "item", lambda: value)(),
+                    "rule": rule,
+                }
+            )
+        paths.append({"leaf": int(leaves[r]), "conditions": conditions})
+    return paths
+
+
+def decision_path_explanation(model_bundle: dict, X: pd.DataFrame) -> list[dict]:
+    """
+    Decision Tree only: the conditions each row satisfied on its way to a leaf,
+    with thresholds converted back from standardized to original units.
+    Returns one {"leaf", "conditions"} dict per row of X.
+    """
+    X = X[model_bundle["X_cols"]]
+    Xt = model_bundle["pipeline"].named_steps["pre"].transform(X)
+    return _decision_paths(model_bundle, Xt, X)
+
+
+def canonical_input(model_bundle: dict, input_row: pd.DataFrame) -> pd.DataFrame:
+    """
+    input_row with its X_cols in training order, numbers rounded to
+    INPUT_DIGITS significant digits, missing values as NaN and categorical
+    text matched to the training category spelling (case and surrounding
+    whitespace ignored). Rows that only differ in those ways score the same.
+    """
+    spellings: dict[str, dict] = {}
+    for src in feature_sources(model_bundle):
+        if src[0] == "cat" and isinstance(src[2], str):
+            spellings.setdefault(src[1], {})[src[2].strip().casefold()] = src[2]
+
+    record = {}
+    for col, v in input_row.iloc[0][model_bundle["X_cols"]].items():
+        if v is None or (isinstance(v, float) and np.isnan(v)):
+            v = np.nan
+        elif isinstance(v, str):
+            v = v.strip()
+            v = spellings.get(col, {}).get(v.casefold(), v)
+        elif isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_)):
+            v = float(f"{float(v):.{INPUT_DIGITS}g}")
+        record[col] = v
+    return pd.DataFrame([record], index=input_row.index[:1])
+
+
+def _result_key(model_bundle: dict, row: pd.DataFrame, algo: str, neighbor_index) -> str:
+    # the model version changes whenever the model does, so old results are never hit again
+    version = model_bundle.get("version")
+    if not version:
+        raise ValueError("Results are cached per model version; this bundle has no version.")
+    neighbors = None if neighbor_index is None else [neighbor_index.version, neighbor_index.algorithm, neighbor_index.id_col]
+    values = [None if isinstance(v, float) and np.isnan(v) else v for v in row.iloc[0].tolist()]
+    raw = json.dumps([version, algo, neighbors, values], default=str).encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+def predict_with_explanations(
+    model_bundle: dict, input_row: pd.DataFrame, algo: str, neighbor_index=None, cache: ModelCache | None = None
+) -> dict:
     """
     input_row must be a 1-row DataFrame with the same columns as training X.
+    neighbor_index (neighbors.NeighborIndex) lets KNN explanations name the
+    actual neighbour records instead of training-matrix positions.
+
+    The row is always scored as canonical_input, so the result does not
+    depend on whether a cache is used. With a cache (e.g. RESULT_CACHE) the
+    result is shared per (model version, canonical row); callers must not
+    mutate it, and the bundle must have a version.
     """
+    row = canonical_input(model_bundle, input_row)
+    if cache is not None:
+        key = _result_key(model_bundle, row, algo, neighbor_index)
+        return cache.get_or_train(key, lambda: _predict_one(model_bundle, row, algo, neighbor_index))
+    return _predict_one(model_bundle, row, algo, neighbor_index)
+
+
+def _predict_one(model_bundle: dict, input_row: pd.DataFrame, algo: str, neighbor_index) -> dict:
     pipe: Pipeline = model_bundle["pipeline"]
-    feature_names = model_bundle["feature_names"]
+    model = pipe.named_steps["model"]
+
+    # transform once and call the estimator directly; pipe.predict and
+    # pipe.predict_proba would each re-run the ColumnTransformer
+    with stage("models.preprocess"):
+        Xt = pipe.named_steps["pre"].transform(input_row)
 
-    pred = pipe.predict(input_row)[0]
+    with stage("models.predict"):
+        pred = model.predict(Xt)[0]
     proba = None
-    if hasattr(pipe, "predict_proba"):
+    if hasattr(model, "predict_proba"):
         try:
-            proba = pipe.predict_proba(input_row)[0]
+            with stage("models.predict_proba"):
+                proba = model.predict_proba(Xt)[0]
         except Exception:
             proba = None
 
@@ -118,53 +665,188 @@ def predict_with_explanations(model_bundle: dict, input_row: pd.DataFrame, algo:
         "explanations": {},
     }
 
-    # transformed vector
-    Xt = pipe.named_steps["pre"].transform(input_row)
-    if hasattr(Xt, "toarray"):
-        Xt_dense = Xt.toarray()
-    else:
-        Xt_dense = np.asarray(Xt)
-    x_vec = Xt_dense[0]
+    # Xt stays as the preprocessor returned it (CSR when one-hot outputs dominate)
+    with stage("models.explain"):
+        _explain_one(out["explanations"], model_bundle, Xt, input_row, algo, neighbor_index)
+    count("models.rows_predicted")
+    return out
+
+
+def _explain_one(explanations: dict, model_bundle: dict, Xt, input_row, algo: str, neighbor_index) -> None:
+    # fills `explanations` for a single transformed row
+    pipe: Pipeline = model_bundle["pipeline"]
 
-    # Decision Tree explanation: text rules + path-ish simplification
+    # Decision Tree explanation: the rules this row went through + full tree text (cached)
     if algo == "Decision Tree":
-        tree = pipe.named_steps["model"]
-        try:
-            rule_text = export_text(tree, feature_names=feature_names, decimals=2)
-        except Exception:
-            rule_text = "Rule extraction unavailable."
-        out["explanations"]["tree_rules"] = rule_text
+        explanations["decision_path"] = _decision_paths(model_bundle, Xt, input_row)[0]
+        explanations["tree_rules"] = tree_rules_text(model_bundle)
 
-    # Logistic regression explanation: top contributions
+    # Logistic regression explanation: top contributions per original column
     if algo == "Logistic Regression":
         lr = pipe.named_steps["model"]
-        if hasattr(lr, "coef_") and feature_names is not None:
-            coef = lr.coef_[0]
-            contrib = coef * x_vec
-            top_idx = np.argsort(np.abs(contrib))[::-1][:10]
-            top = []
-            for i in top_idx:
-                top.append(
-                    {
-                        "feature": feature_names[i],
-                        "contribution": float(contrib[i]),
-                        "coef": float(coef[i]),
-                        "value": float(x_vec[i]),
-                    }
-                )
-            out["explanations"]["top_contributions"] = top
-
-    # KNN explanation: nearest neighbors (approx)
+        if hasattr(lr, "coef_"):
+            explanations["top_contributions"] = _top_contributions(model_bundle, lr.coef_[0], Xt, input_row)[0]
+
+    # KNN explanation: nearest neighbors
     if algo == "KNN":
         knn = pipe.named_steps["model"]
+        k = min(5, knn.n_neighbors)
         try:
-            distances, indices = knn.kneighbors(Xt_dense, n_neighbors=min(5, knn.n_neighbors), return_distance=True)
-            out["explanations"]["knn_neighbors"] = {
-                "distances": [float(d) for d in distances[0]],
-                "indices_in_train_space": [int(i) for i in indices[0]],
-                "note": "Indices are in the KNN internal training matrix order (not original Loan_ID/Student_ID).",
-            }
+            if neighbor_index is not None:
+                neighbors = neighbor_index.query_transformed(Xt, k=k)[0]
+                explanations["knn_neighbors"] = {
+                    "distances": [n["distance"] for n in neighbors],
+                    "neighbors": neighbors,
+                }
+            else:
+                distances, indices = knn.kneighbors(Xt, n_neighbors=k, return_distance=True)
+                explanations["knn_neighbors"] = {
+                    "distances": [float(d) for d in distances[0]],
+                    "indices_in_train_space": [int(i) for i in indices[0]],
+                    "note": "Indices are in the KNN internal training matrix order (not original Loan_ID/Student_ID).",
+                }
         except Exception:
-            out["explanations"]["knn_neighbors"] = {"note": "Neighbor explanation unavailable."}
+            explanations["knn_neighbors"] = {"note": "Neighbor explanation unavailable."}
+
+
+def _column_weights(model_bundle: dict, coef: np.ndarray) -> sp.csr_matrix:
+    """
+    (n_transformed, len(X_cols)) matrix holding coef[j] at (j, column j came
+    from), so Xt @ W is coef * x summed per original column for sparse and
+    dense Xt alike.
+    """
+    position = {c: i for i, c in enumerate(model_bundle["X_cols"])}
+    cols = np.fromiter((position[src[1]] for src in feature_sources(model_bundle)), dtype=np.intp)
+    return sp.csr_matrix(
+        (np.asarray(coef, dtype=np.float64), (np.arange(len(cols)), cols)),
+        shape=(len(cols), len(position)),
+    )
+
+
+def _top_contributions(model_bundle: dict, coef: np.ndarray, Xt, X: pd.DataFrame, top_k: int = 10) -> list[list[dict]]:
+    """
+    coef * x per row, summed over each original column's transformed outputs
+    (a one-hot block counts once) and ranked by magnitude. Xt is never
+    densified; only the (n_rows, len(X_cols)) result is.
+    """
+    X_cols = model_bundle["X_cols"]
+    contrib = Xt @ _column_weights(model_bundle, coef)
+    contrib = contrib.toarray() if sp.issparse(contrib) else np.asarray(contrib)
+    k = min(top_k, contrib.shape[1])
+    mag = np.abs(contrib)
+    # argpartition picks the k largest per row, then only those k get sorted
+    part = np.argpartition(-mag, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(part, np.argsort(-np.take_along_axis(mag, part, axis=1), axis=1), axis=1)
+
+    values = [X[c].to_numpy() for c in X_cols]
+    rows = []
+    for r, idx in enumerate(order):
+        row = []
+        for i in idx:
+            value = values[i][r]
+            row.append(
+                {
+                    "feature": X_cols[i],
+                    "contribution": float(contrib[r, i]),
+                    "value": None if pd.isna(value) else getattr(value, "item", lambda: value)(),
+                }
+            )
+        rows.append(row)
+    return rows
+
+
+def _score_chunk(model_bundle: dict, X: pd.DataFrame, algo: str, explain: bool, neighbor_index=None) -> dict:
+    pipe: Pipeline = model_bundle["pipeline"]
+    model = pipe.named_steps["model"]
+
+    # single transform, then the estimator directly (pipe.predict would re-transform)
+    with stage("models.preprocess"):
+        Xt = pipe.named_steps["pre"].transform(X)
+    if hasattr(model, "predict_proba"):
+        with stage("models.predict_proba"):
+            proba = model.predict_proba(Xt)
+        pred = model.classes_[np.argmax(proba, axis=1)]
+    else:
+        proba = None
+        with stage("models.predict"):
+            pred = model.predict(Xt)
+    count("models.rows_predicted", len(X))
+
+    explanations = [{} for _ in range(len(X))]
+    if not explain:
+        return {"predictions": pred, "proba": proba, "explanations": explanations}
+    with stage("models.explain"):
+        _explain_chunk(explanations, model_bundle, Xt, X, algo, neighbor_index)
+    return {"predictions": pred, "proba": proba, "explanations": explanations}
+
+
+def _explain_chunk(explanations: list, model_bundle: dict, Xt, X: pd.DataFrame, algo: str, neighbor_index) -> None:
+    model = model_bundle["pipeline"].named_steps["model"]
+
+    if algo == "Decision Tree":
+        for r, path in enumerate(_decision_paths(model_bundle, Xt, X)):
+            explanations[r]["decision_path"] = path
+
+    if algo == "Logistic Regression" and hasattr(model, "coef_"):
+        for r, top in enumerate(_top_contributions(model_bundle, model.coef_[0], Xt, X)):
+            explanations[r]["top_contributions"] = top
+
+    if algo == "KNN" and neighbor_index is not None:
+        for r, neighbors in enumerate(neighbor_index.query_transformed(Xt, k=min(5, model.n_neighbors))):
+            explanations[r]["knn_neighbors"] = {"distances": [n["distance"] for n in neighbors], "neighbors": neighbors}
+    elif algo == "KNN":
+        distances, indices = model.kneighbors(Xt, n_neighbors=min(5, model.n_neighbors), return_distance=True)
+        for r in range(len(X)):
+            explanations[r]["knn_neighbors"] = {
+                "distances": [float(d) for d in distances[r]],
+                "indices_in_train_space": [int(i) for i in indices[r]],
+            }
+
+
+def iter_predict_batch(
+    model_bundle: dict,
+    X: pd.DataFrame,
+    algo: str,
+    chunk_size: int = 10_000,
+    explain: bool = True,
+    neighbor_index=None,
+):
+    """
+    Yields predict_batch-shaped results for consecutive chunks of X,
+    so memory stays bounded by chunk_size rather than len(X).
+    """
+    X = X[model_bundle["X_cols"]]
+    for start in range(0, len(X), chunk_size):
+        yield _score_chunk(model_bundle, X.iloc[start:start + chunk_size], algo, explain, neighbor_index)
+
 
-    return out
\ No newline at end of file
+def predict_batch(
+    model_bundle: dict,
+    X: pd.DataFrame,
+    algo: str,
+    chunk_size: int = 10_000,
+    explain: bool = True,
+    neighbor_index=None,
+) -> dict:
+    """
+    Vectorized counterpart of predict_with_explanations for an N-row DataFrame.
+
+    Returns dict with:
+      - predictions (n,)
+      - proba (n, n_classes) or None
+      - classes
+      - explanations: one dict per row (decision_path / top_contributions / knn_neighbors)
+    """
+    model = model_bundle["pipeline"].named_steps["model"]
+    parts = list(
+        iter_predict_batch(model_bundle, X, algo, chunk_size=chunk_size, explain=explain, neighbor_index=neighbor_index)
+    )
+    if not parts:
+        return {"predictions": np.array([]), "proba": None, "classes": list(model.classes_), "explanations": []}
+
+    return {
+        "predictions": np.concatenate([p["predictions"] for p in parts]),
+        "proba": None if parts[0]["proba"] is None else np.vstack([p["proba"] for p in parts]),
+        "classes": list(model.classes_),
+        "explanations": [e for p in parts for e in p["explanations"]],
+    }
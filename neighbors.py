@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import BallTree, KDTree, KNeighborsClassifier
+
+from lib.models import training_rows
+
+
+NEIGHBOR_ALGORITHMS = ["auto", "kd_tree", "ball_tree", "approx"]
+
+
+def _model_matrix(model_bundle: dict, n_rows: int):
+    """
+    The fitted KNN's own float64 training matrix and search tree when they
+    cover exactly the bundle's training rows in euclidean space, else None.
+    Compact KNN is skipped: its float32 / int8 matrix would not be exact.
+    """
+    model = model_bundle["pipeline"].named_steps["model"]
+    if type(model) is not KNeighborsClassifier:
+        return None
+    if getattr(model, "n_samples_fit_", None) != n_rows or model.effective_metric_ != "euclidean":
+        return None
+    X = model._fit_X
+    if hasattr(X, "toarray"):
+        return np.ascontiguousarray(X.toarray(), dtype=np.float64), None
+    tree = model._tree if model._fit_method in ("kd_tree", "ball_tree") else None
+    return np.asarray(X, dtype=np.float64), tree
+
+
+class NeighborIndex:
+    """
+    Nearest-neighbour search over a bundle's training rows, in the same
+    preprocessed space the model sees, that answers with the original
+    records (ID, label, raw column values) instead of matrix positions.
+
+    algorithm:
+      - "kd_tree" / "ball_tree": exact search
+      - "auto": kd_tree up to 15 transformed features, ball_tree above
+      - "approx": inverted-file search; rows are bucketed by k-means and a
+        query only scans the `n_probe` closest buckets
+
+    For a plain KNN bundle the index reuses the model's training matrix, and
+    for an exact algorithm its KD/Ball tree, instead of building another one.
+    """
+
+    def __init__(
+        self,
+        model_bundle: dict,
+        df: pd.DataFrame,
+        id_col: str | None = None,
+        target_col: str | None = None,
+        algorithm: str = "auto",
+        leaf_size: int = 40,
+        n_lists: int | None = None,
+        n_probe: int = 4,
+    ):
+        if algorithm not in NEIGHBOR_ALGORITHMS:
+            raise ValueError(f"Unknown neighbor algorithm: {algorithm}")
+        if "train_index" not in model_bundle:
+            raise ValueError("Bundle has no train_index; retrain it to build a neighbor index.")
+
+        pre = model_bundle["pipeline"].named_steps["pre"]
+        rows = training_rows(model_bundle, df)
+
+        shared = _model_matrix(model_bundle, len(rows))
+        if shared is None:
+            Xt = pre.transform(rows[model_bundle["X_cols"]])
+            X = np.ascontiguousarray(Xt.toarray() if hasattr(Xt, "toarray") else Xt, dtype=np.float64)
+            model_tree = None
+        else:
+            X, model_tree = shared
+
+        self.version = model_bundle.get("version")
+        self.id_col = id_col
+        self.target_col = target_col
+        self.requested_algorithm = algorithm
+        self.ids = rows[id_col].to_numpy() if id_col else rows.index.to_numpy()
+        self.labels = rows[target_col].to_numpy() if target_col else None
+        self.records = rows.reset_index(drop=True)
+
+        tree_kind = None if model_tree is None else ("kd_tree" if isinstance(model_tree, KDTree) else "ball_tree")
+        if algorithm == "auto":
+            algorithm = tree_kind or ("kd_tree" if X.shape[1] <= 15 else "ball_tree")
+        self.algorithm = algorithm
+        self.n_probe = n_probe
+
+        if tree_kind == algorithm:
+            self._tree = model_tree
+        elif algorithm == "kd_tree":
+            self._tree = KDTree(X, leaf_size=leaf_size)
+        elif algorithm == "ball_tree":
+            self._tree = BallTree(X, leaf_size=leaf_size)
+        else:
+            n_lists = n_lists or max(1, int(np.sqrt(len(X))))
+            km = MiniBatchKMeans(n_clusters=min(n_lists, len(X)), random_state=42, n_init=3).fit(X)
+            self._X = X
+            self._centroids = km.cluster_centers_
+            assign = km.labels_
+            order = np.argsort(assign, kind="stable")
+            # rows grouped by bucket: bucket b is order[starts[b]:starts[b + 1]]
+            self._order = order
+            self._starts = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _search_approx(self, Q: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        n_probe = min(self.n_probe, len(self._centroids))
+        c_d2 = ((Q[:, None, :] - self._centroids[None, :, :]) ** 2).sum(axis=2)
+        probes = np.argpartition(c_d2, n_probe - 1, axis=1)[:, :n_probe]
+
+        dist = np.full((len(Q), k), np.inf)
+        ind = np.full((len(Q), k), -1, dtype=np.intp)
+        for r, buckets in enumerate(probes):
+            cand = np.concatenate([self._order[self._starts[b]:self._starts[b + 1]] for b in buckets])
+            d = np.sqrt(((self._X[cand] - Q[r]) ** 2).sum(axis=1))
+            kk = min(k, len(cand))
+            top = np.argpartition(d, kk - 1)[:kk]
+            top = top[np.argsort(d[top])]
+            dist[r, :kk] = d[top]
+            ind[r, :kk] = cand[top]
+        return dist, ind
+
+    def search(self, Xt, k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Raw search on already-transformed rows: (distances, positions), each (n, k).
+        Positions index self.ids / self.labels / self.records.
+        """
+        Q = np.asarray(Xt.toarray() if hasattr(Xt, "toarray") else Xt, dtype=np.float64)
+        k = min(k, len(self))
+        if self.algorithm == "approx":
+            return self._search_approx(Q, k)
+        return self._tree.query(Q, k=k, return_distance=True, sort_results=True)
+
+    def query_transformed(self, Xt, k: int = 5) -> list[list[dict]]:
+        """
+        Neighbours of already-transformed rows, one list of records per row.
+        """
+        distances, positions = self.search(Xt, k)
+        out = []
+        for dist_row, pos_row in zip(distances, positions):
+            neighbors = []
+            for d, p in zip(dist_row, pos_row):
+                if p < 0:
+                    continue
+                neighbors.append(
+                    {
+                        "id": self.ids[p].item() if hasattr(self.ids[p], "item") else self.ids[p],
+                        "label": None if self.labels is None else self.labels[p],
+                        "distance": float(d),
+                        "record": self.records.iloc[int(p)].to_dict(),
+                    }
+                )
+            out.append(neighbors)
+        return out
+
+    def save(self, path: str | Path) -> None:
+        joblib.dump(self, path, compress=0)
+
+    @staticmethod
+    def load(path: str | Path, mmap: bool = True) -> "NeighborIndex":
+        return joblib.load(path, mmap_mode="r" if mmap else None)
+
+
+_INDEXES: OrderedDict[tuple, NeighborIndex] = OrderedDict()
+_INDEXES_LOCK = threading.Lock()
+MAX_INDEXES = 32
+
+
+def get_neighbor_index(
+    model_bundle: dict,
+    df: pd.DataFrame,
+    id_col: str | None = None,
+    target_col: str | None = None,
+    algorithm: str = "auto",
+    path: str | Path | None = None,
+) -> NeighborIndex:
+    """
+    Shared NeighborIndex for a model version: built on first use, then reused
+    by every request in the process. With `path`, the index is also loaded
+    from / saved to disk so it survives restarts.
+    """
+    key = (model_bundle.get("version"), id_col, target_col, algorithm)
+    with _INDEXES_LOCK:
+        if key in _INDEXES:
+            _INDEXES.move_to_end(key)
+            return _INDEXES[key]
+
+    index = None
+    if path is not None and Path(path).is_file():
+        try:
+            index = NeighborIndex.load(path)
+        except Exception:
+            index = None
+        # the file may hold another version's index, or one built for other columns
+        if index is not None and (
+            index.version,
+            index.id_col,
+            index.target_col,
+            getattr(index, "requested_algorithm", None),
+        ) != key:
+            index = None
+    if index is None:
+        index = NeighborIndex(model_bundle, df, id_col=id_col, target_col=target_col, algorithm=algorithm)
+        if path is not None:
+            try:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                index.save(path)
+            except OSError:
+                pass
+
+    with _INDEXES_LOCK:
+        _INDEXES[key] = index
+        while len(_INDEXES) > MAX_INDEXES:
+            _INDEXES.popitem(last=False)
+    return index
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import pandas as pd
+import sklearn
+
+from lib.data import DATASET_SCHEMAS, load_loan_df, load_student_df
+from lib.models import ALGORITHMS, MODEL_CACHE, ModelCache, get_model, model_version, train_model
+
+
+# <project>/model_registry next to lib/ and pages/, overridable for deployments
+REGISTRY_DIR = Path(
+    os.environ.get("XPLAINLAB_REGISTRY_DIR", Path(__file__).resolve().parent.parent / "model_registry")
+)
+
+BUNDLE_FILE = "bundle.joblib"
+META_FILE = "meta.json"
+# 2: estimators are compacted (lib.compact) before saving
+# 3: KNN storage defaulted to float64, so default KNN versions meant float64
+# 4: back to float32 by default; format-3 default KNN bundles are float64
+FORMAT_VERSION = 4
+
+
+def _bundle_dir(version: str, root: Path | None = None) -> Path:
+    # one folder per model version, one subfolder per sklearn version
+    return Path(root or REGISTRY_DIR) / version / f"sklearn-{sklearn.__version__}"
+
+
+def _artifact_dir(version: str, root: Path | None = None) -> Path:
+    # beside the bundle folder, not in it: save_bundle swaps that folder whole
+    return Path(root or REGISTRY_DIR) / version / f"artifacts-sklearn-{sklearn.__version__}"
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _is_current(meta: dict | None) -> bool:
+    return meta is not None and meta.get("format") == FORMAT_VERSION and meta.get("sklearn_version") == sklearn.__version__
+
+
+def save_bundle(bundle: dict, root: Path | None = None, replace: bool = False) -> Path:
+    """
+    Persist a train_model bundle. Written uncompressed so numpy arrays
+    (e.g. the KNN training matrix) can be memory-mapped on load.
+    The folder is built in a temp dir and renamed into place, so readers
+    never see a half-written bundle. Artifacts (save_artifact) live in a
+    sibling folder, so replacing a bundle keeps them.
+
+    A version is a content hash, so one already saved in the current format
+    is kept as it is and its folder returned; this is also what happens to
+    the loser when two processes save the same version at once. A saved copy
+    in an older format is only replaced with replace=True (the caller checks
+    nobody has it mapped); otherwise FileExistsError.
+    """
+    target = _bundle_dir(bundle["version"], root)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if (target / META_FILE).exists():
+        if _is_current(read_meta(bundle["version"], root)):
+            return target
+        if not replace:
+            raise FileExistsError(f"{target} holds an outdated bundle; pass replace=True to overwrite it")
+
+    tmp = Path(tempfile.mkdtemp(prefix=".tmp-", dir=target.parent))
+    try:
+        joblib.dump(bundle, tmp / BUNDLE_FILE, compress=0)
+        meta = {
+            "format": FORMAT_VERSION,
+            "version": bundle["version"],
+            "algo": bundle.get("algo"),
+            "target_col": bundle.get("target_col"),
+            "params": bundle.get("params", {}),
+            "X_cols": bundle.get("X_cols"),
+            "metrics": bundle.get("metrics", {}),
+            "sklearn_version": sklearn.__version__,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sha256": _sha256_file(tmp / BUNDLE_FILE),
+            "size_bytes": (tmp / BUNDLE_FILE).stat().st_size,
+            # the rename below keeps the file's mtime, so loads can check it cheaply
+            "mtime_ns": (tmp / BUNDLE_FILE).stat().st_mtime_ns,
+        }
+        (tmp / META_FILE).write_text(json.dumps(meta, indent=2, default=str))
+
+        old = None
+        if target.exists() and not _is_current(read_meta(bundle["version"], root)):
+            # an outdated bundle (replace=True): rename it aside rather than
+            # deleting it first, so the folder is missing only between two renames
+            old = Path(tempfile.mkdtemp(prefix=".old-", dir=target.parent))
+            os.replace(target, old / target.name)
+        try:
+            os.replace(tmp, target)
+        except OSError:
+            # another process renamed its copy of this version into place first
+            if not _is_current(read_meta(bundle["version"], root)):
+                raise
+            shutil.rmtree(tmp, ignore_errors=True)
+        finally:
+            if old is not None:
+                shutil.rmtree(old, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return target
+
+
+def read_meta(version: str, root: Path | None = None) -> dict | None:
+    path = _bundle_dir(version, root) / META_FILE
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def load_bundle(version: str, root: Path | None = None, mmap: bool = True, verify: bool = False) -> dict | None:
+    """
+    Load a saved bundle, or None if it is missing, was written by another
+    sklearn version, or fails the integrity check.
+
+    The default check compares the file's size and mtime with the values
+    recorded at save time, so a memory-mapped load reads no array pages.
+    verify=True also re-hashes the whole file against the saved sha256.
+
+    Only load registries you wrote yourself: bundles are pickles.
+    """
+    folder = _bundle_dir(version, root)
+    meta = read_meta(version, root)
+    if not _is_current(meta):
+        return None
+
+    path = folder / BUNDLE_FILE
+    try:
+        st = path.stat()
+        if st.st_size != meta["size_bytes"] or st.st_mtime_ns != meta.get("mtime_ns", st.st_mtime_ns):
+            return None
+        if verify and _sha256_file(path) != meta["sha256"]:
+            return None
+        bundle = joblib.load(path, mmap_mode="r" if mmap else None)
+    except Exception:
+        return None
+
+    if bundle.get("version") != version:
+        return None
+    return bundle
+
+
+def save_artifact(version: str, name: str, payload: dict, root: Path | None = None) -> Path:
+    """
+    Store a JSON result derived from a model version (e.g. feature importance)
+    next to its bundle, so it is computed once per model rather than per process.
+    """
+    folder = _artifact_dir(version, root)
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"{name}.json"
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    try:
+        tmp.write_text(json.dumps(payload, indent=2, default=str))
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return path
+
+
+def load_artifact(version: str, name: str, root: Path | None = None) -> dict | None:
+    try:
+        return json.loads((_artifact_dir(version, root) / f"{name}.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def list_versions(root: Path | None = None) -> list[str]:
+    """
+    Versions saved for the running sklearn version.
+    """
+    root = Path(root or REGISTRY_DIR)
+    if not root.is_dir():
+        return []
+    sub = f"sklearn-{sklearn.__version__}"
+    return sorted(p.name for p in root.iterdir() if (p / sub / META_FILE).is_file())
+
+
+def train_or_load(df: pd.DataFrame, target_col: str, algo: str, params: dict | None = None, root: Path | None = None) -> dict:
+    """
+    Drop-in for train_model: reuse the saved bundle if there is one,
+    otherwise fit and save it for the next process. Either way the returned
+    arrays are memory-mapped from the registry and shared with other
+    processes (lib.shared).
+    """
+    from lib.shared import attach, publish
+
+    version = model_version(df, target_col, algo, params)
+    bundle = attach(version, root)
+    if bundle is not None:
+        return bundle
+
+    # read-only deployments still work, they just retrain after restart
+    return publish(train_model(df, target_col, algo, params), root)
+
+
+def preload(cache: ModelCache | None = None, root: Path | None = None) -> int:
+    """
+    Warm start: load every saved bundle into the model cache.
+    Returns the number of bundles loaded.
+    """
+    from lib.shared import attach
+
+    cache = cache or MODEL_CACHE
+    loaded = 0
+    for version in list_versions(root)[: cache.maxsize]:
+        if cache.get(version) is not None:
+            continue
+        bundle = attach(version, root)
+        if bundle is not None:
+            cache.put(version, bundle)
+            loaded += 1
+    return loaded
+
+
+def prewarm(
+    datasets: tuple = ("loan", "student"),
+    algos: list[str] | None = None,
+    cache: ModelCache | None = None,
+    root: Path | None = None,
+) -> list[str]:
+    """
+    Startup hook: preload saved bundles, then make sure the bundles the
+    prediction pages ask for first (each algorithm on the sample datasets,
+    trained on the same frame the pages use) are cached, fitting and saving
+    any that are missing, along with their k-fold evaluations. Returns their
+    versions.
+    """
+    from lib.evaluation import get_evaluation
+
+    loaders = {"loan": load_loan_df, "student": load_student_df}
+    preload(cache, root)
+    versions = []
+    for name in datasets:
+        schema = DATASET_SCHEMAS[name]
+        train_df = loaders[name](compact=True).drop(columns=[schema.id_col])
+        for algo in algos or ALGORITHMS:
+            bundle = get_model(
+                train_df,
+                target_col=schema.target_col,
+                algo=algo,
+                cache=cache,
+                trainer=lambda df, target, a, params: train_or_load(df, target, a, params, root=root),
+            )
+            versions.append(bundle["version"])
+            try:
+                # the prediction pages show these in the model caption
+                get_evaluation(bundle, train_df, root=root)
+            except ValueError:
+                pass
+    return versions
@@ -0,0 +1,392 @@
+"""
+Headless HTTP scoring service for the loan / student models (stdlib asyncio only).
+
+    python -m lib.service serve --port 8600
+    python -m lib.service loadgen --url http://127.0.0.1:8600 --concurrency 64 --requests 5000
+
+Endpoints:
+    POST /predict/<dataset>/<algo>   body: one JSON record -> {"prediction", "proba"}
+                                     (400 if a numeric field is not a number)
+    GET  /health
+    GET  /stats                      per-model request / batch counters
+    GET  /metrics                    stage timings, Prometheus text format
+    GET  /drift                      input drift vs training data per dataset (lib.drift)
+
+<dataset> is "loan" or "student"; <algo> is a slug of ALGORITHMS
+("decision_tree", "knn", "logistic_regression").
+
+Concurrent requests for the same model are coalesced into micro-batches
+(up to --max-batch rows, waiting at most --max-wait-ms for the batch to
+fill) and scored in a thread pool, so the event loop never runs model code.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from lib.compiled import compile_bundle
+from lib.data import DATASET_SCHEMAS, load_loan_df, load_student_df
+from lib.drift import get_monitor
+from lib.instrument import REGISTRY, enable, stage
+from lib.models import ALGORITHMS, get_model, predict_batch
+from lib.registry import train_or_load
+
+
+LOADERS = {"loan": load_loan_df, "student": load_student_df}
+
+
+def algo_slug(algo: str) -> str:
+    return algo.lower().replace(" ", "_")
+
+
+class Scorer:
+    """
+    Batch scoring for one bundle: the compiled NumPy predictor when the model
+    supports it, predict_batch otherwise. Every scored batch is also counted
+    by the dataset's drift monitor, if given.
+    """
+
+    def __init__(self, model_bundle: dict, monitor=None):
+        self.bundle = model_bundle
+        self.monitor = monitor
+        self.classes = [str(c) for c in model_bundle["pipeline"].named_steps["model"].classes_]
+        pre = model_bundle["pipeline"].named_steps["pre"]
+        self.num_cols = next((list(c) for n, _, c in pre.transformers_ if n == "num"), [])
+        try:
+            self.compiled = compile_bundle(model_bundle)
+        except ValueError:
+            self.compiled = None
+
+    def validate(self, record: dict) -> dict:
+        """
+        Copy of record with numeric fields as floats (blank -> None, imputed
+        like a missing value). Raises ValueError naming the first field that
+        is not a number, so a bad record is rejected before it joins a batch.
+        """
+        out = dict(record)
+        for col in self.num_cols:
+            v = out.get(col)
+            if v is None or isinstance(v, float):
+                continue
+            if isinstance(v, str) and not v.strip():
+                out[col] = None
+                continue
+            try:
+                out[col] = float(v)
+            except (TypeError, ValueError):
+                raise ValueError(f"{col}: expected a number, got {v!r}") from None
+        return out
+
+    def __call__(self, records: list[dict]) -> list[dict]:
+        if self.compiled is not None:
+            with stage("service.score_compiled"):
+                labels, proba = self.compiled.predict(records)
+        else:
+            res = predict_batch(self.bundle, pd.DataFrame(records), self.bundle["algo"], explain=False)
+            labels, proba = res["predictions"], res["proba"]
+        if self.monitor is not None:
+            with stage("service.drift"):
+                self.monitor.update(records)
+        return [
+            {"prediction": str(label), "proba": dict(zip(self.classes, map(float, p)))}
+            for label, p in zip(labels, proba)
+        ]
+
+
+class MicroBatcher:
+    """
+    Collects single-record requests into batches: a batch is dispatched when it
+    reaches max_batch rows or max_wait_ms after its first request arrived.
+    If scoring a batch fails, its records are re-scored one by one so only the
+    failing request gets the error.
+    """
+
+    def __init__(self, score_fn, executor: Executor, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.score_fn = score_fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.requests = 0
+        self.batches = 0
+        self._task: asyncio.Task | None = None
+        self._inflight: set = set()
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._collect())
+
+    async def submit(self, record: dict) -> dict:
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((record, fut))
+        return await fut
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # keep collecting while this batch is being scored
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: list) -> None:
+        loop = asyncio.get_running_loop()
+        self.requests += len(batch)
+        self.batches += 1
+        try:
+            results = await loop.run_in_executor(self.executor, self.score_fn, [r for r, _ in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(exc)
+                return
+            for record, fut in batch:
+                try:
+                    res = (await loop.run_in_executor(self.executor, self.score_fn, [record]))[0]
+                except Exception as row_exc:
+                    if not fut.done():
+                        fut.set_exception(row_exc)
+                else:
+                    if not fut.done():
+                        fut.set_result(res)
+            return
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "queued": self.queue.qsize(),
+        }
+
+
+def load_scorers(datasets=("loan", "student"), algos=ALGORITHMS) -> dict:
+    """
+    {(dataset, algo_slug): Scorer}, trained or loaded through the model registry.
+    """
+    scorers = {}
+    for name in datasets:
+        schema = DATASET_SCHEMAS[name]
+        train_df = LOADERS[name](compact=True).drop(columns=[schema.id_col])
+        monitor = get_monitor(train_df, columns=schema.feature_cols)
+        for algo in algos:
+            bundle = get_model(train_df, schema.target_col, algo, trainer=train_or_load)
+            scorers[(name, algo_slug(algo))] = Scorer(bundle, monitor)
+    return scorers
+
+
+# --- HTTP plumbing
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    method, target, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b"\n", b""):
+            break
+        k, _, v = h.decode("latin-1").partition(":")
+        headers[k.strip().lower()] = v.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+    return method, target, headers, body
+
+
+def _response(status: int, payload, keep_alive: bool) -> bytes:
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+    if isinstance(payload, str):
+        body, ctype = payload.encode(), "text/plain; version=0.0.4"
+    else:
+        body, ctype = json.dumps(payload).encode(), "application/json"
+    head = (
+        f"HTTP/1.1 {status} {reason}\r\n"
+        f"Content-Type: {ctype}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+class ScoringServer:
+    def __init__(self, scorers: dict, workers: int = 4, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="score")
+        self.scorers = scorers
+        self.batchers: dict = {}
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+
+    async def _route(self, method: str, target: str, body: bytes) -> tuple[int, object]:
+        parts = [p for p in target.split("?", 1)[0].split("/") if p]
+        if method == "GET" and parts == ["health"]:
+            return 200, {"status": "ok", "models": ["/".join(k) for k in self.scorers]}
+        if method == "GET" and parts == ["stats"]:
+            return 200, {"/".join(k): b.stats() for k, b in self.batchers.items()}
+        if method == "GET" and parts == ["metrics"]:
+            return 200, REGISTRY.to_prometheus()
+        if method == "GET" and parts == ["drift"]:
+            monitors = {k[0]: s.monitor for k, s in self.scorers.items() if s.monitor is not None}
+            return 200, {name: {"n_seen": m.n_seen, "features": m.report()} for name, m in monitors.items()}
+        if method == "POST" and len(parts) == 3 and parts[0] == "predict":
+            batcher = self.batchers.get((parts[1], parts[2]))
+            if batcher is None:
+                return 404, {"error": f"unknown model {parts[1]}/{parts[2]}"}
+            try:
+                record = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {"error": "body must be a JSON object"}
+            if not isinstance(record, dict):
+                return 400, {"error": "body must be a JSON object"}
+            try:
+                record = self.scorers[(parts[1], parts[2])].validate(record)
+            except ValueError as exc:
+                return 400, {"error": str(exc)}
+            return 200, await batcher.submit(record)
+        return 404, {"error": "not found"}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                req = await _read_request(reader)
+                if req is None:
+                    break
+                method, target, headers, body = req
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                try:
+                    status, payload = await self._route(method, target, body)
+                except Exception as exc:
+                    status, payload = 500, {"error": str(exc)}
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        for key, scorer in self.scorers.items():
+            batcher = MicroBatcher(scorer, self.executor, self.max_batch, self.max_wait_ms)
+            batcher.start()
+            self.batchers[key] = batcher
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"serving {len(self.scorers)} models on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+# --- load generator
+
+
+async def _client(host: str, port: int, path: str, records: list[dict], n: int, latencies: list, errors: list):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n):
+            body = json.dumps(random.choice(records)).encode()
+            req = (
+                f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n"
+            ).encode() + body
+            t0 = time.perf_counter()
+            writer.write(req)
+            await writer.drain()
+            status = await reader.readline()
+            length = 0
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b""):
+                    break
+                if h.lower().startswith(b"content-length:"):
+                    length = int(h.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - t0)
+            if b" 200 " not in status:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_loadgen(url: str, dataset: str, algo: str, concurrency: int, requests: int) -> dict:
+    """
+    Fire `requests` single-record predictions over `concurrency` keep-alive
+    connections; report throughput and latency percentiles.
+    """
+    u = urlparse(url)
+    schema = DATASET_SCHEMAS[dataset]
+    df = LOADERS[dataset]().drop(columns=[schema.id_col, schema.target_col])
+    records = json.loads(df.to_json(orient="records"))
+    path = f"/predict/{dataset}/{algo}"
+
+    latencies: list = []
+    errors: list = []
+    counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    t0 = time.perf_counter()
+    await asyncio.gather(
+        *[_client(u.hostname, u.port, path, records, n, latencies, errors) for n in counts if n]
+    )
+    elapsed = time.perf_counter() - t0
+
+    lat = np.array(latencies) * 1000.0
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m lib.service")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("serve", help="run the scoring server")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8600)
+    s.add_argument("--workers", type=int, default=4)
+    s.add_argument("--max-batch", type=int, default=64)
+    s.add_argument("--max-wait-ms", type=float, default=5.0)
+    s.add_argument("--no-timing", action="store_true", help="do not record stage timings for /metrics")
+
+    g = sub.add_parser("loadgen", help="measure throughput and latency of a running server")
+    g.add_argument("--url", default="http://127.0.0.1:8600")
+    g.add_argument("--dataset", default="loan", choices=list(LOADERS))
+    g.add_argument("--algo", default="logistic_regression", choices=[algo_slug(a) for a in ALGORITHMS])
+    g.add_argument("--concurrency", type=int, default=32)
+    g.add_argument("--requests", type=int, default=2000)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "serve":
+        enable(not args.no_timing)
+        server = ScoringServer(load_scorers(), args.workers, args.max_batch, args.max_wait_ms)
+        asyncio.run(server.serve(args.host, args.port))
+    else:
+        res = asyncio.run(run_loadgen(args.url, args.dataset, args.algo, args.concurrency, args.requests))
+        print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()
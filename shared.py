@@ -0,0 +1,290 @@
+"""
+Read-only sharing of fitted bundles between server processes on one host.
+
+Registry bundles are uncompressed joblib files and load_bundle memory-maps
+every numpy array in them: the KNN training matrix, tree node arrays,
+coefficients, scaler and imputer statistics, train_index. Processes that
+attach to the same version map the same page-cache pages instead of each
+unpickling a private copy, so adding workers adds little resident memory.
+
+    bundle = publish(trained_bundle)     # save, then re-attach read-only
+    bundle = attach(version)             # already saved by another process
+    detach(version)                      # also done for every lease at exit
+
+Each attaching process leaves a lease file under
+<registry>/.leases/<version>/; refcount() counts the leases of live
+processes and prune() only deletes versions nobody holds.
+
+    python -m lib.shared measure --workers 1 2 4 8
+"""
+from __future__ import annotations
+
+import argparse
+import atexit
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from lib.compact import iter_arrays
+from lib.registry import REGISTRY_DIR, list_versions, load_bundle, save_bundle
+
+
+LEASE_DIR = ".leases"
+
+_HOST = socket.gethostname()
+_leases: set[Path] = set()
+_lock = threading.Lock()
+
+
+def _lease_path(version: str, root: Path | None = None, pid: int | None = None) -> Path:
+    return Path(root or REGISTRY_DIR) / LEASE_DIR / version / f"{_HOST}-{pid or os.getpid()}"
+
+
+def _alive(lease: Path) -> bool:
+    host, _, pid = lease.name.rpartition("-")
+    if host != _HOST or os.name != "posix":
+        # other hosts' (and, on Windows, all) leases are only dropped by detach
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+@atexit.register
+def _release_all() -> None:
+    with _lock:
+        for lease in list(_leases):
+            lease.unlink(missing_ok=True)
+        _leases.clear()
+
+
+def attach(version: str, root: Path | None = None) -> dict | None:
+    """
+    load_bundle with its arrays memory-mapped read-only, recording a lease
+    for this process. None if the version is not in the registry.
+    """
+    bundle = load_bundle(version, root, mmap=True)
+    if bundle is None:
+        return None
+    lease = _lease_path(version, root)
+    with _lock:
+        if lease not in _leases:
+            lease.parent.mkdir(parents=True, exist_ok=True)
+            lease.touch()
+            _leases.add(lease)
+    return bundle
+
+
+def detach(version: str, root: Path | None = None) -> None:
+    """
+    Drop this process's lease. Mapped arrays already handed out stay valid;
+    the OS releases the pages once nothing references them.
+    """
+    lease = _lease_path(version, root)
+    with _lock:
+        lease.unlink(missing_ok=True)
+        _leases.discard(lease)
+
+
+def publish(bundle: dict, root: Path | None = None) -> dict:
+    """
+    Save a freshly trained bundle and return the attached, memory-mapped copy,
+    so the process that trained it shares the arrays like everyone else.
+
+    If another process already saved the version, that copy is attached and
+    nothing is written; a saved version is never deleted under live leases.
+    Falls back to the in-memory bundle when the registry is not writable, or
+    when an outdated copy of the version is still attached elsewhere.
+    """
+    version = bundle["version"]
+    saved = attach(version, root)
+    if saved is not None:
+        return saved
+    try:
+        save_bundle(bundle, root, replace=not refcount(version, root))
+    except OSError:
+        return bundle
+    return attach(version, root) or bundle
+
+
+def refcount(version: str, root: Path | None = None) -> int:
+    """
+    Number of live processes attached to version; stale leases are removed.
+    """
+    folder = Path(root or REGISTRY_DIR) / LEASE_DIR / version
+    if not folder.is_dir():
+        return 0
+    n = 0
+    for lease in folder.iterdir():
+        if _alive(lease):
+            n += 1
+        else:
+            lease.unlink(missing_ok=True)
+    return n
+
+
+def prune(keep=(), root: Path | None = None) -> list[str]:
+    """
+    Delete saved versions that are not in keep and have no live attachments.
+    Returns the removed versions.
+    """
+    root = Path(root or REGISTRY_DIR)
+    removed = []
+    for version in list_versions(root):
+        if version in keep or refcount(version, root):
+            continue
+        shutil.rmtree(root / version, ignore_errors=True)
+        shutil.rmtree(root / LEASE_DIR / version, ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+def mapped_nbytes(bundle: dict) -> dict:
+    """
+    Array bytes of a bundle that are memory-mapped (shared) vs held privately.
+    A plain sklearn Tree copies its arrays when unpickled, so they count as private.
+    """
+    out = {"mapped": 0, "private": 0}
+    for a in iter_arrays(bundle):
+        out["mapped" if isinstance(a, np.memmap) else "private"] += a.nbytes
+    return out
+
+
+# --- measurement
+
+
+def _memory() -> dict:
+    # Linux only: resident, proportional and private memory of this process, bytes
+    try:
+        lines = Path("/proc/self/smaps_rollup").read_text().splitlines()
+    except OSError:
+        return {}
+    kb = {}
+    for line in lines[1:]:
+        key, _, rest = line.partition(":")
+        if rest.strip().endswith("kB"):
+            kb[key] = int(rest.split()[0]) * 1024
+    return {
+        "rss": kb.get("Rss", 0),
+        "pss": kb.get("Pss", 0),
+        "private": kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0),
+    }
+
+
+def _worker(root: str, versions: list[str], mmap: bool) -> None:
+    # attach, touch every array page, report; then wait so the parent can
+    # read proportional memory while all workers are alive. Estimator modules
+    # are imported first so only the bundles themselves are counted.
+    import sklearn.compose, sklearn.linear_model, sklearn.pipeline, sklearn.preprocessing  # noqa: E401,F401
+
+    before = _memory()
+    bundles = [load_bundle(v, Path(root), mmap=mmap) for v in versions]
+    for b in bundles:
+        for a in iter_arrays(b):
+            if a.size and a.dtype != object:
+                a.max()
+    after = _memory()
+    print(json.dumps({k: after[k] - before[k] for k in after}), flush=True)
+    sys.stdin.readline()
+    print(json.dumps({"pss": _memory()["pss"] - before["pss"]}), flush=True)
+    sys.stdin.readline()
+
+
+def measure(workers=(1, 2, 4), versions: list[str] | None = None, root: Path | None = None) -> list[dict]:
+    """
+    Memory added per worker process by loading the given registry versions
+    (default: all), memory-mapped vs unpickled into private copies.
+    """
+    root = Path(root or REGISTRY_DIR)
+    versions = versions or list_versions(root)
+    rows = []
+    for mmap in (True, False):
+        for n in workers:
+            procs = [
+                subprocess.Popen(
+                    [sys.executable, "-m", "lib.shared", "_worker", str(root), str(int(mmap)), *versions],
+                    cwd=Path(__file__).absolute().parent.parent,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    text=True,
+                )
+                for _ in range(n)
+            ]
+            first = [json.loads(p.stdout.readline()) for p in procs]
+            for p in procs:
+                p.stdin.write("\n")
+                p.stdin.flush()
+            second = [json.loads(p.stdout.readline()) for p in procs]
+            for p in procs:
+                p.stdin.write("\n")
+                p.stdin.close()
+                p.wait()
+            row = {
+                "mode": "mmap" if mmap else "copy",
+                "workers": n,
+                "private_per_worker": sum(f["private"] for f in first) / n,
+                "pss_total": sum(s["pss"] for s in second),
+            }
+            rows.append(row)
+            print(
+                f"{row['mode']:5s} workers={n:<3d} private/worker {row['private_per_worker'] / 2**20:8.1f} MiB"
+                f"  total pss {row['pss_total'] / 2**20:8.1f} MiB",
+                flush=True,
+            )
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m lib.shared")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    m = sub.add_parser("measure", help="memory per worker, memory-mapped vs private bundles")
+    m.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    m.add_argument("--versions", nargs="+")
+    m.add_argument("--registry")
+    m.add_argument("--out")
+
+    s = sub.add_parser("status", help="attached processes per saved version")
+    s.add_argument("--registry")
+
+    p = sub.add_parser("prune", help="delete saved versions no live process is attached to")
+    p.add_argument("--keep", nargs="*", default=[])
+    p.add_argument("--registry")
+
+    w = sub.add_parser("_worker")
+    w.add_argument("root")
+    w.add_argument("mmap", type=int)
+    w.add_argument("versions", nargs="*")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "_worker":
+        _worker(args.root, args.versions, bool(args.mmap))
+        return 0
+    root = Path(args.registry) if args.registry else None
+    if args.cmd == "status":
+        for v in list_versions(root):
+            print(f"{v}  {refcount(v, root)}")
+    elif args.cmd == "prune":
+        for v in prune(args.keep, root):
+            print(f"removed {v}")
+    else:
+        rows = measure(args.workers, args.versions, root)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from joblib import Memory
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import GridSearchCV, HalvingGridSearchCV, StratifiedKFold
+from sklearn.pipeline import Pipeline
+
+from lib.models import ModelCache, build_model, build_preprocessor, get_model, model_version
+
+
+PARAM_GRIDS = {
+    "Decision Tree": {
+        "max_depth": [2, 3, 4, 5, 6, 8, None],
+        "min_samples_leaf": [1, 2, 5, 10],
+        "criterion": ["gini", "entropy"],
+    },
+    "KNN": {
+        "n_neighbors": [1, 3, 5, 7, 9, 15],
+        "weights": ["uniform", "distance"],
+        "p": [1, 2],
+    },
+    "Logistic Regression": {
+        "C": [0.01, 0.1, 1.0, 10.0, 100.0],
+    },
+}
+
+# below this many rows successive halving has too little data per rung
+HALVING_MIN_ROWS = 200
+
+TUNING_CACHE = ModelCache(maxsize=64)
+
+
+def tune_model(
+    df: pd.DataFrame,
+    target_col: str,
+    algo: str,
+    grid: dict | None = None,
+    cv: int = 5,
+    search: str = "auto",
+    scoring: str = "accuracy",
+    n_jobs: int = -1,
+) -> dict:
+    """
+    Cross-validated search over `grid` (default PARAM_GRIDS[algo]) on all cores.
+
+    The pipeline gets a joblib Memory, so each fold's ColumnTransformer is
+    fitted once and reused by every candidate evaluated on that fold.
+    search: "grid", "halving" (successive halving over n_samples) or "auto"
+    (halving from HALVING_MIN_ROWS rows up).
+
+    Returns dict with best_params (plain estimator params, ready for
+    train_model), best_score, n_candidates, search and cv.
+    """
+    df = df.dropna(subset=[target_col])
+    X = df.drop(columns=[target_col])
+    y = df[target_col].astype(str)
+
+    grid = dict(grid or PARAM_GRIDS[algo])
+    if search == "auto":
+        search = "halving" if len(X) >= HALVING_MIN_ROWS else "grid"
+
+    # every fold needs each class at least once
+    n_splits = int(max(2, min(cv, y.value_counts().min())))
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+
+    # KNN cannot ask for more neighbours than a training fold holds
+    fold_rows = len(X) - -(-len(X) // n_splits)
+    if "n_neighbors" in grid:
+        grid["n_neighbors"] = [k for k in grid["n_neighbors"] if k <= fold_rows] or [1]
+
+    cache_dir = tempfile.mkdtemp(prefix="xplainlab-cv-")
+    try:
+        pipe = Pipeline(
+            steps=[("pre", build_preprocessor(X)), ("model", build_model(algo))],
+            memory=Memory(cache_dir, verbose=0),
+        )
+        param_grid = {f"model__{k}": v for k, v in grid.items()}
+        if search == "halving":
+            # the first rung must still hold the largest k in every training fold
+            min_resources = max(2 * n_splits * y.nunique(), 2 * max(grid.get("n_neighbors", [1])))
+            searcher = HalvingGridSearchCV(
+                pipe,
+                param_grid,
+                cv=splitter,
+                scoring=scoring,
+                n_jobs=n_jobs,
+                factor=3,
+                min_resources=min(min_resources, len(X)),
+                random_state=42,
+            )
+        else:
+            searcher = GridSearchCV(pipe, param_grid, cv=splitter, scoring=scoring, n_jobs=n_jobs)
+        searcher.fit(X, y)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    best = {k.split("__", 1)[1]: _plain(v) for k, v in searcher.best_params_.items()}
+    return {
+        "best_params": best,
+        "best_score": float(searcher.best_score_),
+        "n_candidates": int(len(searcher.cv_results_["params"])),
+        "search": search,
+        "cv": n_splits,
+    }
+
+
+def _plain(v):
+    # numpy scalars -> python, so params hash the same as hand-written ones
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def get_tuning(df: pd.DataFrame, target_col: str, algo: str, **kwargs) -> dict:
+    """
+    tune_model, cached per (data, target, algo) for the life of the process.
+    """
+    key = model_version(df, target_col, algo, {"tuning": kwargs})
+    return TUNING_CACHE.get_or_train(key, lambda: tune_model(df, target_col, algo, **kwargs))
+
+
+def get_tuned_model(df: pd.DataFrame, target_col: str, algo: str, trainer=None, **kwargs) -> dict:
+    """
+    Tune, then train (through the shared model cache) with the winning params.
+    The bundle's metrics gain cv_score from the search.
+    """
+    tuning = get_tuning(df, target_col, algo, **kwargs)
+    bundle = get_model(df, target_col, algo, params=tuning["best_params"], trainer=trainer)
+    # shallow copy: cached bundles are shared and must not be mutated
+    return {**bundle, "metrics": {**bundle["metrics"], "cv_score": tuning["best_score"]}}
@@ -1,7 +1,23 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
 import streamlit as st
 
+from lib.instrument import REGISTRY, breakdown, is_enabled, start_trace, stop_trace
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas/numpy and the model modules are imported inside the panels that use
+# them, so pages that only show forms or redirect stay cheap to load
+
 APP_NAME = "XplainLab"
 
+# st.fragment (Streamlit >= 1.37) reruns just the decorated panel on input;
+# older versions rerun the whole page, which is slower but behaves the same
+_fragment = getattr(st, "fragment", lambda fn: fn)
+
 def set_app_config():
     st.set_page_config(
         page_title=APP_NAME,
@@ -27,4 +43,152 @@ def sidebar_user_card():
                 st.rerun()
         else:
             st.warning("Not logged in")
-            st.caption("Go to **Login** page.")
\ No newline at end of file
+            st.caption("Go to **Login** page.")
+
+def begin_stage_timing():
+    """
+    Expert mode: collect stage timings for this rerun. Returns the span list
+    for stage_timing_panel, or None in Beginner mode (timers stay no-ops).
+    """
+    if st.session_state.get("mode") == "Expert":
+        return start_trace()
+    stop_trace()
+    return None
+
+def stage_timing_panel(spans):
+    if spans is None:
+        return
+    import pandas as pd
+
+    with st.expander("⏱️ Stage timings (this run)"):
+        rows = breakdown(spans)
+        if not rows:
+            st.caption("No instrumented stages ran.")
+        else:
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+            st.caption("Nested stages are listed separately, so a parent's time includes its children.")
+        from lib.models import RESULT_CACHE
+
+        cache = RESULT_CACHE.stats()
+        if cache["hit_rate"] is not None:
+            st.caption(
+                f"Prediction cache: {cache['hits']} hits / {cache['misses']} misses "
+                f"({cache['hit_rate']:.0%}), {cache['size']} of {cache['maxsize']} results kept."
+            )
+        if is_enabled():
+            c1, c2 = st.columns(2)
+            c1.download_button("Process metrics (Prometheus)", REGISTRY.to_prometheus(), "metrics.prom")
+            c2.download_button("Process metrics (JSON lines)", REGISTRY.to_json_lines(), "metrics.jsonl")
+
+
+@_fragment
+def whatif_panel(model_bundle: dict, base_row: pd.DataFrame, data: pd.DataFrame):
+    """
+    Sensitivity of the current prediction to one or two inputs. Runs as a
+    fragment where Streamlit supports it, so dragging a slider re-scores the
+    grid without rerunning the page.
+    """
+    import numpy as np
+    import pandas as pd
+
+    from lib.visuals import sweep_chart
+    from lib.whatif import sweep, value_grid
+
+    cols = model_bundle["X_cols"]
+    numeric = [c for c in cols if pd.api.types.is_numeric_dtype(data[c])]
+    continuous = [c for c in numeric if pd.api.types.is_float_dtype(data[c])] or numeric
+    features = st.multiselect(
+        "Vary one or two inputs", cols, default=continuous[:1], max_selections=2, key="whatif_features"
+    )
+    if not features:
+        st.caption("Pick an input to see how the decision responds to it.")
+        return
+
+    grid = {}
+    for f in features:
+        if f not in numeric:
+            grid[f] = value_grid(data, f)
+            continue
+        lo, hi = value_grid(data, f, n=2)
+        current = pd.to_numeric(base_row[f], errors="coerce").fillna(0).iloc[0]
+        top = float(max(data[f].max(), current) * 1.5) or 1.0
+        rng = st.slider(f"{f} range", min_value=0.0, max_value=top, value=(float(lo), float(hi)), key=f"whatif_{f}")
+        grid[f] = np.linspace(rng[0], rng[1], 80 if len(features) == 1 else 40)
+
+    result = sweep(model_bundle, base_row, grid)
+    st.image(sweep_chart(result))
+    st.caption(
+        f"Current input: P({result['positive_class']}) = {result['base_proba']:.3f}. "
+        f"{len(result['crossings'])} decision-boundary crossing(s) in this range."
+    )
+    if result["crossings"]:
+        st.dataframe(pd.DataFrame(result["crossings"]).head(200), use_container_width=True, hide_index=True)
+
+
+def model_quality_panel(model_bundle: dict, train_df: pd.DataFrame):
+    """
+    k-fold accuracy and ROC-AUC with bootstrap intervals under the model
+    caption; Expert mode also gets every metric per fold. Cached per model
+    version (and filled by the startup prewarm for the sample datasets).
+    """
+    from lib.evaluation import evaluation_frame, get_evaluation
+
+    try:
+        quality = get_evaluation(model_bundle, train_df)
+    except ValueError as e:
+        st.caption(str(e))
+        return
+    acc, auc = quality["metrics"]["accuracy"], quality["metrics"]["roc_auc"]
+    st.caption(
+        f"{quality['n_splits']}-fold accuracy: **{acc['value']:.3f}** (95% CI {acc['ci_low']:.3f}–{acc['ci_high']:.3f}) | "
+        f"ROC-AUC: **{auc['value']:.3f}** (95% CI {auc['ci_low']:.3f}–{auc['ci_high']:.3f})"
+    )
+    if "cv_score" in model_bundle["metrics"]:
+        st.caption("Hyperparameters were tuned by cross-validation on these rows, so these scores are optimistic.")
+    if st.session_state.get("mode") == "Expert":
+        with st.expander("Model quality (stratified k-fold)"):
+            st.dataframe(evaluation_frame(quality), use_container_width=True, hide_index=True)
+            st.caption(
+                f"Out-of-fold predictions over {quality['n_rows']} rows; intervals from {quality['n_boot']} "
+                f"bootstrap resamples. Precision and recall are for class {quality['positive_class']}."
+            )
+
+
+def attribution_panel(model_bundle: dict, input_row: pd.DataFrame, train_df: pd.DataFrame):
+    """
+    SHAP attributions of the current input per original column, the same
+    kind of answer for every algorithm.
+    """
+    from lib.attribution import attribution_table, explain
+
+    result = explain(model_bundle, input_row, train_df)
+    table = attribution_table(result, input_row)
+    unit = "log-odds" if result["output"] == "log-odds" else "probability"
+    st.write(f"Feature attributions ({result['method']} SHAP, in {unit} of {result['positive_class']}):")
+    st.dataframe(table, use_container_width=True, hide_index=True)
+    baseline = "the average training applicant" if result["method"] != "tree" else "the tree's average prediction"
+    st.caption(
+        f"Starting from {baseline} ({result['base_value']:.3f}), each attribution is how much that input "
+        f"moved the output; together they add up to this input's {unit} "
+        f"({result['base_value'] + result['values'][0].sum():.3f})."
+    )
+
+
+def drift_panel(monitor):
+    """
+    Expert mode: how the inputs submitted so far (by every session) compare
+    with the training data, per feature.
+    """
+    if st.session_state.get("mode") != "Expert":
+        return
+    import pandas as pd
+
+    from lib.drift import MIN_ROWS
+
+    with st.expander("📈 Input drift vs training data"):
+        st.dataframe(pd.DataFrame(monitor.report()), use_container_width=True, hide_index=True)
+        st.caption(
+            f"{monitor.n_seen} inputs seen by this server. PSI below 0.1 is stable and above 0.25 is drift; "
+            f"KS is the largest gap between the live and training distributions. "
+            f"Statuses appear after {MIN_ROWS} inputs."
+        )
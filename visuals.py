@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from lib.data import fingerprint_df
+from lib.instrument import count, stage
+
+
+# above this many rows charts are drawn from aggregates instead of raw points
+LARGE_ROWS = 50_000
+FIGSIZE = (6, 4)
+
+
+class ChartCache:
+    """
+    Bounded LRU of rendered chart bytes, keyed by data fingerprint + chart spec.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._items: OrderedDict[tuple, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> bytes | None:
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self._items.move_to_end(key)
+                self.hits += 1
+            return data
+
+    def put(self, key: tuple, data: bytes) -> None:
+        with self._lock:
+            self._items[key] = data
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "bytes": sum(len(v) for v in self._items.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+CHART_CACHE = ChartCache(maxsize=64)
+
+
+def _render(draw, fmt: str) -> bytes:
+    # a bare Figure is never registered with pyplot, so nothing outlives this call
+    fig = Figure(figsize=FIGSIZE)
+    FigureCanvasAgg(fig)
+    try:
+        draw(fig.subplots())
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format=fmt, dpi=100)
+        return buf.getvalue()
+    finally:
+        fig.clear()
+
+
+def _draw_count(ax, df: pd.DataFrame, x: str) -> None:
+    counts = df[x].value_counts(sort=False, dropna=True)
+    if isinstance(df[x].dtype, pd.CategoricalDtype):
+        counts = counts.reindex(df[x].cat.categories, fill_value=0)
+    ax.bar([str(i) for i in counts.index], counts.to_numpy(), color=[f"C{i}" for i in range(len(counts))])
+    ax.set_xlabel(x)
+    ax.set_ylabel("count")
+
+
+def _draw_box(ax, df: pd.DataFrame, x: str, y: str) -> None:
+    if len(df) <= LARGE_ROWS:
+        import seaborn as sns
+
+        sns.boxplot(data=df, x=x, y=y, ax=ax)
+        return
+    # large data: five-number summaries per group, no per-point fliers
+    stats = []
+    for name, values in df.groupby(x, observed=True)[y]:
+        v = values.dropna().to_numpy(dtype=np.float64)
+        if not len(v):
+            continue
+        q1, med, q3 = np.percentile(v, [25, 50, 75])
+        iqr = q3 - q1
+        stats.append(
+            {
+                "label": str(name),
+                "q1": q1,
+                "med": med,
+                "q3": q3,
+                "whislo": max(v.min(), q1 - 1.5 * iqr),
+                "whishi": min(v.max(), q3 + 1.5 * iqr),
+                "fliers": [],
+            }
+        )
+    ax.bxp(stats, showfliers=False)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+
+
+def _draw_scatter(ax, df: pd.DataFrame, x: str, y: str, hue: str | None) -> None:
+    if len(df) <= LARGE_ROWS:
+        import seaborn as sns
+
+        sns.scatterplot(data=df, x=x, y=y, hue=hue, ax=ax)
+        return
+    # large data: hexagonal bins; with a hue, colour is the share of the last class
+    xs = df[x].to_numpy(dtype=np.float64)
+    ys = df[y].to_numpy(dtype=np.float64)
+    if hue is None:
+        hb = ax.hexbin(xs, ys, gridsize=40, mincnt=1, cmap="viridis")
+        ax.figure.colorbar(hb, ax=ax, label="rows")
+    else:
+        labels = df[hue].astype(str)
+        positive = sorted(labels.dropna().unique())[-1]
+        share = (labels == positive).to_numpy(dtype=np.float64)
+        hb = ax.hexbin(xs, ys, C=share, reduce_C_function=np.mean, gridsize=40, mincnt=1, cmap="coolwarm")
+        ax.figure.colorbar(hb, ax=ax, label=f"share {hue}={positive}")
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+
+
+def chart(
+    df: pd.DataFrame,
+    kind: str,
+    x: str,
+    y: str | None = None,
+    hue: str | None = None,
+    title: str = "",
+    fmt: str = "png",
+    fingerprint: str | None = None,
+) -> bytes:
+    """
+    Dataset-level chart as PNG/SVG bytes, rendered once per data fingerprint.
+    kind: "count", "box" or "scatter".
+    """
+    fingerprint = fingerprint or fingerprint_df(df)
+    key = (fingerprint, kind, x, y, hue, title, fmt)
+    data = CHART_CACHE.get(key)
+    if data is not None:
+        count("visuals.chart_cache_hit")
+        return data
+
+    def draw(ax):
+        if kind == "count":
+            _draw_count(ax, df, x)
+        elif kind == "box":
+            _draw_box(ax, df, x, y)
+        elif kind == "scatter":
+            _draw_scatter(ax, df, x, y, hue)
+        else:
+            raise ValueError(f"Unknown chart kind: {kind}")
+        ax.set_title(title)
+
+    with stage("visuals.render"):
+        data = _render(draw, fmt)
+    CHART_CACHE.put(key, data)
+    return data
+
+
+def sweep_chart(result: dict, title: str = "", fmt: str = "png") -> bytes:
+    """
+    Sensitivity curve (one feature) or heatmap (two features) of a
+    whatif.sweep result, with the decision boundary marked. Not cached: sweeps
+    change with every input.
+    """
+    features, values, proba = result["features"], result["values"], result["proba"]
+    label = f"P({result['positive_class']})"
+
+    def draw(ax):
+        if len(features) == 1:
+            x = values[0]
+            numeric = np.issubdtype(np.asarray(x).dtype, np.number)
+            pos = x if numeric else np.arange(len(x))
+            ax.plot(pos, proba, marker="" if numeric else "o")
+            ax.axhline(0.5, color="grey", linestyle=":", linewidth=1)
+            if numeric:
+                for c in result["crossings"]:
+                    ax.axvline(c[features[0]], color="C3", linestyle="--", linewidth=1)
+            else:
+                ax.set_xticks(pos, [str(v) for v in x])
+            ax.set_ylim(-0.02, 1.02)
+            ax.set_xlabel(features[0])
+            ax.set_ylabel(label)
+        else:
+            x, y = (np.asarray(v) for v in values)
+            im = ax.pcolormesh(
+                np.arange(len(x)) if x.dtype == object else x,
+                np.arange(len(y)) if y.dtype == object else y,
+                proba.T,
+                shading="auto",
+                cmap="RdYlGn",
+                vmin=0.0,
+                vmax=1.0,
+            )
+            ax.figure.colorbar(im, ax=ax, label=label)
+            if x.dtype != object and y.dtype != object and len(x) > 1 and len(y) > 1:
+                ax.contour(x, y, proba.T, levels=[0.5], colors="k", linewidths=1)
+            ax.set_xlabel(features[0])
+            ax.set_ylabel(features[1])
+        ax.set_title(title)
+
+    with stage("visuals.render"):
+        return _render(draw, fmt)
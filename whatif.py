@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from lib.instrument import stage
+from lib.models import feature_sources
+
+
+# above this many grid points a sweep is refused rather than silently slow
+MAX_GRID_POINTS = 250_000
+
+
+def value_grid(df: pd.DataFrame, feature: str, n: int = 50, lo: float | None = None, hi: float | None = None):
+    """
+    Default sweep values for one feature: n evenly spaced points between the
+    1st and 99th percentile of the data (or lo/hi), or every category.
+    """
+    s = df[feature]
+    if not pd.api.types.is_numeric_dtype(s):
+        cats = s.cat.categories if isinstance(s.dtype, pd.CategoricalDtype) else s.dropna().unique()
+        return np.asarray(sorted(map(str, cats)), dtype=object)
+    values = pd.to_numeric(s, errors="coerce").dropna().to_numpy(dtype=np.float64)
+    q_lo, q_hi = np.percentile(values, [1, 99]) if len(values) else (0.0, 1.0)
+    return np.linspace(q_lo if lo is None else lo, q_hi if hi is None else hi, n)
+
+
+def _base_matrix(model_bundle: dict, base_row) -> np.ndarray:
+    if isinstance(base_row, dict):
+        base_row = pd.DataFrame([base_row])
+    Xt = model_bundle["pipeline"].named_steps["pre"].transform(base_row[model_bundle["X_cols"]])
+    return Xt.toarray() if hasattr(Xt, "toarray") else np.asarray(Xt, dtype=np.float64)
+
+
+def _column_writers(model_bundle: dict, feature: str):
+    """
+    Transformed columns a raw feature feeds, as a function values -> block.
+    Numeric features are standardized; categoricals become one-hot rows
+    (all zeros for categories the encoder never saw).
+    """
+    sources = feature_sources(model_bundle)
+    idx = [j for j, src in enumerate(sources) if src[1] == feature]
+    if not idx:
+        raise ValueError(f"{feature!r} is not a model feature")
+    if sources[idx[0]][0] == "num":
+        _, _, mean, scale = sources[idx[0]]
+        return idx, lambda v: ((np.asarray(v, dtype=np.float64) - mean) / scale)[:, None]
+    cats = np.asarray([str(sources[j][2]) for j in idx], dtype=object)
+    return idx, lambda v: (np.asarray(v, dtype=object).astype(str)[:, None] == cats[None, :]).astype(np.float64)
+
+
+def positive_index(classes, positive_class) -> int:
+    """
+    Column of the class treated as positive: positive_class when given,
+    else "Y" / "Yes", else the last class.
+    """
+    classes = [str(c) for c in classes]
+    if positive_class is not None:
+        return classes.index(str(positive_class))
+    for name in ("Y", "Yes"):
+        if name in classes:
+            return classes.index(name)
+    return len(classes) - 1
+
+
+def _plain(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def _crossings(values, proba, labels, threshold: float | None) -> list[tuple]:
+    """
+    (position along `values`, from label, to label) wherever the predicted
+    label changes between neighbouring grid points. With a binary threshold
+    the position is interpolated where proba crosses it, else the midpoint.
+    """
+    out = []
+    for i in np.flatnonzero(labels[1:] != labels[:-1]):
+        a, b = values[i], values[i + 1]
+        if threshold is not None and isinstance(a, (int, float, np.number)) and proba[i + 1] != proba[i]:
+            t = float(np.clip((threshold - proba[i]) / (proba[i + 1] - proba[i]), 0.0, 1.0))
+            at = float(a + t * (b - a))
+        elif isinstance(a, (int, float, np.number)):
+            at = float((a + b) / 2.0)
+        else:
+            at = b
+        out.append((_plain(at), _plain(labels[i]), _plain(labels[i + 1])))
+    return out
+
+
+def sweep(model_bundle: dict, base_row, grid: dict, positive_class=None) -> dict:
+    """
+    Score a base applicant with one or two features varied over value grids,
+    e.g. grid={"ApplicantIncome": np.linspace(0, 20000, 81), "LoanAmount": np.linspace(50, 400, 36)}.
+
+    The base row is transformed once; the grid is written straight into the
+    transformed matrix (swept columns only) and scored with a single
+    predict_proba call.
+
+    Returns dict with:
+      - features, values (one array per swept feature)
+      - proba: probability of positive_class, shape (len(v1),) or (len(v1), len(v2))
+      - prediction: predicted labels, same shape
+      - base_proba, base_prediction: for the unmodified row
+      - crossings: decision-boundary points, each {feature, <f1>, <f2>, from, to};
+        `feature` is the axis along which the label flips
+    """
+    features = list(grid)
+    if not 1 <= len(features) <= 2:
+        raise ValueError("sweep takes one or two features")
+    values = [np.asarray(grid[f]) for f in features]
+    shape = tuple(len(v) for v in values)
+    n = int(np.prod(shape))
+    if n > MAX_GRID_POINTS:
+        raise ValueError(f"grid has {n} points; at most {MAX_GRID_POINTS} are allowed")
+
+    model = model_bundle["pipeline"].named_steps["model"]
+    base = _base_matrix(model_bundle, base_row)
+
+    with stage("whatif.sweep"):
+        M = np.repeat(base, n + 1, axis=0)
+        # meshgrid in "ij" order so row-major reshape gives shape (len(v1), len(v2))
+        mesh = np.meshgrid(*[np.arange(s) for s in shape], indexing="ij")
+        for f, v, pos in zip(features, values, mesh):
+            idx, write = _column_writers(model_bundle, f)
+            M[1:, idx] = write(v[pos.ravel()])
+        P = model.predict_proba(M)
+
+    classes = model.classes_
+    k = positive_index(classes, positive_class)
+    labels = classes[np.argmax(P, axis=1)]
+    proba = P[1:, k].reshape(shape)
+    pred = labels[1:].reshape(shape)
+    threshold = 0.5 if len(classes) == 2 else None
+
+    crossings = []
+    if len(features) == 1:
+        for at, a, b in _crossings(values[0], proba, pred, threshold):
+            crossings.append({"feature": features[0], features[0]: at, "from": a, "to": b})
+    else:
+        f1, f2 = features
+        for j, y in enumerate(values[1]):
+            for at, a, b in _crossings(values[0], proba[:, j], pred[:, j], threshold):
+                crossings.append({"feature": f1, f1: at, f2: _plain(y), "from": a, "to": b})
+        for i, x in enumerate(values[0]):
+            for at, a, b in _crossings(values[1], proba[i, :], pred[i, :], threshold):
+                crossings.append({"feature": f2, f1: _plain(x), f2: at, "from": a, "to": b})
+
+    return {
+        "features": features,
+        "values": values,
+        "proba": proba,
+        "prediction": pred,
+        "positive_class": _plain(classes[k]),
+        "base_proba": float(P[0, k]),
+        "base_prediction": _plain(labels[0]),
+        "crossings": crossings,
+    }